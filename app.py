@@ -1,11 +1,22 @@
 import os
+import json
 import tempfile
 import logging
-from flask import Flask, request, jsonify, render_template
-import camelot
-import pandas as pd
-import datetime
-from ocr_processor import process_image_with_ocr
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import Flask, Response, request, jsonify, render_template, send_file
+from ocr_processor import get_ocr_client, get_ocr_cache, find_duplicate_images, ocr_tier_stats
+from ocr_pipeline import run_ocr_pipeline
+from records import Record, records_from_situaciones
+from pdf_extractor import BACKENDS, normalize_situaciones
+from extraction_cache import ExtractionCache
+from extraction_jobs import DONE, QUEUED, RUNNING, ExtractionJobs, JobQueueFull
+from thumbnails import ThumbnailStore
+from vacation_calculator import calculate_non_overlapping_vacation_days
+from calculation_session import CalculationSession
+from vacation_timeline import VacationTimeline
 from PIL import Image
 
 app = Flask(__name__)
@@ -15,157 +26,37 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def extract_situaciones(pdf_path, pages="all"):
-    """
-    Extract situations from PDF labor life report.
-    """
-    tablas = camelot.read_pdf(pdf_path, pages=pages, flavor="stream")
-    registros, corriente = [], None
-
-    for tabla in tablas:
-        df = tabla.df
-
-        for _, fila_raw in df.iterrows():
-            # Normalize: remove line breaks and extra spaces
-            fila = [" ".join(str(c).split()) for c in fila_raw.tolist()]
-
-            # Filter headers and separators
-            if (fila[0].upper().startswith(("RÉGIMEN", "SITUACIÓN"))
-                or fila[0] == "" and not fila[1].isdigit()):
-                continue
-
-            # Continuation rows (cell 0 is empty)
-            if fila[0] == "":
-                if corriente and fila[2]:
-                    corriente["Empresa"] += " " + fila[2]
-                continue
-
-            # Fill missing cells to avoid index errors
-            while len(fila) < 10:
-                fila.append("")
-
-            corriente = {
-                "Regimen":           fila[0],
-                "Codigo_Empresa":    fila[1],
-                "Empresa":           fila[2],
-                "Fecha_Alta":        fila[3],
-                "Fecha_Efecto_Alta": fila[4],
-                "Fecha_Baja":        fila[5],
-                "C.T.":              fila[6],
-                "CTP_%":             fila[7],
-                "G.C.":              fila[8],
-                "Dias":              fila[9],
-            }
-            registros.append(corriente)
-
-    return pd.DataFrame(registros)
-
-def format_date(date_str):
-    """Format date from DD.MM.YYYY to DD/MM/YYYY"""
-    try:
-        d = datetime.datetime.strptime(date_str, "%d.%m.%Y")
-        return d.strftime("%d/%m/%Y")
-    except Exception:
-        return ""
+# PDF extraction backend: "camelot" or "text" (PDF text layer, no Ghostscript)
+PDF_EXTRACTION_BACKEND = os.environ.get('PDF_EXTRACTION_BACKEND', 'camelot')
+# Processes used to extract the PDF pages in parallel. Requests already run
+# side by side, so pages are extracted in the request's thread by default
+PDF_EXTRACTION_WORKERS = int(os.environ.get('PDF_EXTRACTION_WORKERS', 1))
 
-def calculate_non_overlapping_vacation_days(data):
-    """
-    Calculate vacation days that don't overlap with contract periods.
-    Returns both the total days and the specific non-overlapping periods.
-    """
-    vacations = [item for item in data if item["isVacaciones"]]
-    contracts = [item for item in data if not item["isVacaciones"]]
-    
-    total_non_overlapping_days = 0
-    non_overlapping_periods = []
-    
-    for vacation in vacations:
-        if not vacation["fechaAlta"] or not vacation["fechaBaja"]:
-            continue
-            
-        try:
-            vac_start = datetime.datetime.strptime(vacation["fechaAlta"], "%d/%m/%Y")
-            vac_end = datetime.datetime.strptime(vacation["fechaBaja"], "%d/%m/%Y")
-        except ValueError:
-            continue
-            
-        # Find overlapping contracts
-        overlapping_periods = []
-        
-        for contract in contracts:
-            if not contract["fechaAlta"]:
-                continue
-                
-            try:
-                contract_start = datetime.datetime.strptime(contract["fechaAlta"], "%d/%m/%Y")
-                # If contract has no end date, assume it's still active (use today)
-                if contract["fechaBaja"]:
-                    contract_end = datetime.datetime.strptime(contract["fechaBaja"], "%d/%m/%Y")
-                else:
-                    contract_end = datetime.datetime.now()
-                    
-                # Check if vacation overlaps with contract
-                if vac_start <= contract_end and vac_end >= contract_start:
-                    # Calculate overlapping period
-                    overlap_start = max(vac_start, contract_start)
-                    overlap_end = min(vac_end, contract_end)
-                    overlapping_periods.append((overlap_start, overlap_end))
-                    
-            except ValueError:
-                continue
-        
-        # Calculate non-overlapping periods for this vacation
-        if not overlapping_periods:
-            # No overlap, count all vacation days
-            vacation_days = (vac_end - vac_start).days + 1
-            total_non_overlapping_days += vacation_days
-            non_overlapping_periods.append({
-                "start": vac_start.strftime("%d/%m/%Y"),
-                "end": vac_end.strftime("%d/%m/%Y"),
-                "days": vacation_days
-            })
-        else:
-            # Merge overlapping periods and calculate non-overlapping segments
-            overlapping_periods.sort()
-            merged_overlaps = []
-            
-            for overlap in overlapping_periods:
-                if not merged_overlaps or merged_overlaps[-1][1] < overlap[0]:
-                    merged_overlaps.append(overlap)
-                else:
-                    merged_overlaps[-1] = (merged_overlaps[-1][0], max(merged_overlaps[-1][1], overlap[1]))
-            
-            # Find non-overlapping segments within this vacation
-            current_pos = vac_start
-            
-            for overlap_start, overlap_end in merged_overlaps:
-                # Add period before this overlap (if any)
-                if current_pos < overlap_start:
-                    segment_end = overlap_start - datetime.timedelta(days=1)
-                    segment_days = (segment_end - current_pos).days + 1
-                    if segment_days > 0:
-                        total_non_overlapping_days += segment_days
-                        non_overlapping_periods.append({
-                            "start": current_pos.strftime("%d/%m/%Y"),
-                            "end": segment_end.strftime("%d/%m/%Y"),
-                            "days": segment_days
-                        })
-                
-                # Move current position past this overlap
-                current_pos = overlap_end + datetime.timedelta(days=1)
-            
-            # Add remaining period after all overlaps (if any)
-            if current_pos <= vac_end:
-                segment_days = (vac_end - current_pos).days + 1
-                if segment_days > 0:
-                    total_non_overlapping_days += segment_days
-                    non_overlapping_periods.append({
-                        "start": current_pos.strftime("%d/%m/%Y"),
-                        "end": vac_end.strftime("%d/%m/%Y"),
-                        "days": segment_days
-                    })
-    
-    return total_non_overlapping_days, non_overlapping_periods
+# Extracted PDF tables keyed by file contents, so re-uploads skip the extraction
+extraction_cache = ExtractionCache(
+    os.environ.get('EXTRACTION_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'extraction_cache')),
+    max_bytes=int(os.environ.get('EXTRACTION_CACHE_MAX_BYTES', 50 * 1024 * 1024)))
+
+# Downscaled previews of the uploaded images, served by GET /thumbnails/<key>.jpg
+thumbnail_store = ThumbnailStore(
+    os.environ.get('THUMBNAIL_DIR', os.path.join(tempfile.gettempdir(), 'thumbnails')),
+    max_size=int(os.environ.get('THUMBNAIL_SIZE', 1200)),
+    max_bytes=int(os.environ.get('THUMBNAIL_MAX_BYTES', 100 * 1024 * 1024)))
+
+# Background extraction jobs (POST /extract/jobs), shared by every app process
+# through EXTRACTION_JOBS_DB: EXTRACTION_JOB_WORKERS run at a time in each
+# process and at most MAX_PENDING_EXTRACTION_JOBS may wait or run in all
+extraction_jobs = ExtractionJobs(
+    os.environ.get('EXTRACTION_JOBS_DB', os.path.join(tempfile.gettempdir(), 'extraction_jobs.sqlite3')),
+    max_workers=int(os.environ.get('EXTRACTION_JOB_WORKERS', 2)),
+    max_pending=int(os.environ.get('MAX_PENDING_EXTRACTION_JOBS', 20)))
+# Seconds between reads of the events of a streamed extraction job
+STREAM_POLL_INTERVAL = 0.25
+
+# Incremental calculation sessions, least recently used first
+MAX_CALCULATION_SESSIONS = int(os.environ.get('MAX_CALCULATION_SESSIONS', 200))
+calculation_sessions = OrderedDict()
+calculation_sessions_lock = threading.Lock()
 
 @app.route('/')
 def index():
@@ -175,162 +66,322 @@ def index():
 def extract_data():
     """Step 1: Extract data from PDF or images and return editable records"""
     try:
-        # Check if it's PDF or images
-        if 'pdf' in request.files and request.files['pdf'].filename:
-            return extract_pdf()
-        elif 'images' in request.files:
-            return extract_images()
-        else:
-            return jsonify({'error': 'No PDF or images uploaded'}), 400
-            
+        upload = save_upload()
+        return jsonify(run_extraction(upload))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def extract_pdf():
-    """Extract data from PDF"""
-    file = request.files['pdf']
-    if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
-    
-    if not file.filename.lower().endswith('.pdf'):
-        return jsonify({'error': 'File must be a PDF'}), 400
-    
-    # Save uploaded file to temporary location
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-        file.save(temp_file.name)
-        temp_path = temp_file.name
-    
+@app.route('/extract/jobs', methods=['POST'])
+def create_extraction_job():
+    """Queue the extraction of a PDF or images; poll the returned job for the result"""
     try:
-        # Extract data from PDF
-        df = extract_situaciones(temp_path, pages="all")
-        
-        # Extract only relevant records
-        output_data = []
-        for _, row in df.iterrows():
-            empresa = row["Empresa"]
-            
-            # Check if it's a vacation record
-            if empresa.startswith("VACACIONES RETRIBUIDAS Y NO"):
-                output_data.append({
-                    "type": "vacation",
-                    "fechaAlta": format_date(row["Fecha_Alta"]),
-                    "fechaBaja": format_date(row["Fecha_Baja"])
-                })
-            # Check if it's a health service contract
-            elif empresa == "SERVICIO DE SALUD DEL PRINCIPADO":
-                output_data.append({
-                    "type": "contract",
-                    "fechaAlta": format_date(row["Fecha_Alta"]),
-                    "fechaBaja": format_date(row["Fecha_Baja"])
-                })
-        
-        return jsonify({"data": output_data, "source": "pdf"})
-        
-    finally:
-        # Clean up temporary file
-        os.unlink(temp_path)
+        upload = save_upload()
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        job = extraction_jobs.submit(run_extraction, upload)
+    except JobQueueFull as e:
+        remove_temp_files(upload['paths'])
+        logger.warning(f"Extraction job rejected: {e}")
+        return jsonify({'error': 'El servidor está ocupado, inténtalo de nuevo en unos minutos'}), 503
+
+    logger.info(f"Queued extraction job {job.id} ({upload['source']}, {len(upload['paths'])} files)")
+    return jsonify(job.to_dict()), 202
+
+@app.route('/extract/jobs/<job_id>')
+def get_extraction_job(job_id):
+    """Status, progress and, once done, result of an extraction job"""
+    job = extraction_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown extraction job'}), 404
+    return jsonify(job)
+
+class UploadError(Exception):
+    pass
+
+def save_upload():
+    """
+    Validate the uploaded PDF or images and save them to temporary files.
+    Returns {"source", "paths", "filenames"} plus "backend" for PDFs.
+    """
+    if 'pdf' in request.files and request.files['pdf'].filename:
+        file = request.files['pdf']
+        if not file.filename.lower().endswith('.pdf'):
+            raise UploadError('File must be a PDF')
+        backend = request.form.get('backend', PDF_EXTRACTION_BACKEND)
+        if backend not in BACKENDS:
+            raise UploadError(f'Unknown PDF extraction backend: {backend}')
+
+        # Save uploaded file to temporary location
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+            file.save(temp_file.name)
+        return {"source": "pdf", "paths": [temp_file.name], "filenames": [file.filename], "backend": backend}
+
+    if 'images' not in request.files:
+        raise UploadError('No PDF or images uploaded')
 
-def extract_images():
-    """Extract data from multiple images using OCR"""
-    logger.info("=== Starting image extraction ===")
-    
     files = request.files.getlist('images')
     logger.info(f"Received {len(files)} files")
-    
     if not files or all(f.filename == '' for f in files):
         logger.error("No images selected")
-        return jsonify({'error': 'No images selected'}), 400
-    
+        raise UploadError('No images selected')
+
     # Filter valid image files
     valid_files = []
     for file in files:
         if file.filename and file.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
             valid_files.append(file)
             logger.info(f"Valid image: {file.filename}")
-    
+
     if not valid_files:
         logger.error("No valid image files found")
-        return jsonify({'error': 'No valid image files found'}), 400
+        raise UploadError('No valid image files found')
+
+    # Save all images to temporary locations so they can be OCR'd concurrently
+    temp_paths = []
+    for file in valid_files:
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
+            file.save(temp_file.name)
+            temp_paths.append(temp_file.name)
+            logger.info(f"Saved {file.filename} to temp path: {temp_file.name}")
+    return {"source": "images", "paths": temp_paths, "filenames": [f.filename for f in valid_files]}
+
+def remove_temp_files(paths):
+    for path in paths:
+        try:
+            os.unlink(path)
+            logger.info(f"Cleaned up temp file: {path}")
+        except Exception as e:
+            logger.warning(f"Could not clean up temp file {path}: {e}")
+
+def run_extraction(upload, progress=None):
+    """Extract a saved upload and return the response body; the temporary files are removed"""
+    progress = progress or (lambda **kwargs: None)
+    try:
+        if upload['source'] == 'pdf':
+            return extract_pdf(upload['paths'][0], upload['backend'], progress)
+        return extract_images(upload['filenames'], upload['paths'], progress)
+    finally:
+        remove_temp_files(upload['paths'])
+
+def extract_pdf(temp_path, backend, progress):
+    """Extract data from PDF"""
+    progress(done=0, total=1, stage="pdf")
+    df, cached = extraction_cache.extract(temp_path, pages="auto", backend=backend,
+                                          workers=PDF_EXTRACTION_WORKERS)
+    logger.info(f"PDF extraction {'served from cache' if cached else 'completed'} ({len(df)} rows)")
+    
+    typed, invalid = normalize_situaciones(df)
+    invalid_cells = invalid.to_dict('records')
+    if invalid_cells:
+        logger.warning(f"{len(invalid_cells)} cells could not be parsed: {invalid_cells}")
+
+    # Extract only relevant records
+    output_data = [r.to_editor_dict() for r in records_from_situaciones(typed)]
+    progress(done=1)
     
-    logger.info(f"Processing {len(valid_files)} valid images")
+    return {"data": output_data, "source": "pdf", "invalid_cells": invalid_cells}
+
+def extract_images(filenames, temp_paths, progress):
+    """Extract data from multiple images using OCR"""
+    logger.info("=== Starting image extraction ===")
+    logger.info(f"Processing {len(filenames)} valid images")
     
     all_data = []
     image_results = []
     
-    for i, file in enumerate(valid_files):
-        logger.info(f"=== Processing image {i+1}/{len(valid_files)}: {file.filename} ===")
-        
-        # Save image to temporary location
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-            file.save(temp_file.name)
-            temp_path = temp_file.name
-            logger.info(f"Saved to temp path: {temp_path}")
+    # The same page sent twice is only OCR'd once
+    duplicates = find_duplicate_images(temp_paths)
+    duplicate_images = [{
+        "filename": filenames[i],
+        "duplicate_of": filenames[duplicate['duplicate_of']],
+        "distance": duplicate['distance']
+    } for i, duplicate in duplicates.items()]
+    
+    unique_paths = [path for i, path in enumerate(temp_paths) if i not in duplicates]
+    logger.info(f"Calling OCR processor for {len(unique_paths)} images ({len(duplicates)} duplicates skipped)")
+    completed = [len(duplicates)]
+    progress(done=completed[0], total=len(temp_paths), stage="ocr")
+
+    def on_result(index, ocr_records, records):
+        completed[0] += 1
+        progress(done=completed[0])
+
+    unique_results, pipeline_stats = run_ocr_pipeline(unique_paths, on_result=on_result)
+    logger.info(f"OCR pipeline stages: {pipeline_stats}")
+    unique_results = iter(unique_results)
+    ocr_results = [([], []) if i in duplicates else next(unique_results) for i in range(len(temp_paths))]
+    
+    for i, (filename, temp_path, (ocr_records, records)) in enumerate(zip(filenames, temp_paths, ocr_results)):
+        logger.info(f"=== Processing image {i+1}/{len(filenames)}: {filename} ===")
         
         try:
-            # Process image with OCR
-            logger.info(f"Calling OCR processor for {file.filename}")
-            ocr_records = process_image_with_ocr(temp_path)
-            logger.info(f"OCR returned {len(ocr_records)} records for {file.filename}")
+            if i in duplicates:
+                logger.info(f"{filename} is a duplicate of {filenames[duplicates[i]['duplicate_of']]}")
+
+            logger.info(f"OCR returned {len(ocr_records)} records for {filename}")
             
             if not ocr_records:
-                logger.warning(f"No records extracted from {file.filename}")
-            
-            # Convert OCR format to our format
-            image_data = []
-            for j, record in enumerate(ocr_records):
-                logger.info(f"Record {j+1}: {record}")
-                
-                # Convert dates from DD.MM.YYYY to DD/MM/YYYY
-                fecha_alta = record["fechaAlta"].replace(".", "/") if record["fechaAlta"] else ""
-                fecha_baja = record["fechaBaja"].replace(".", "/") if record["fechaBaja"] else ""
-                
-                logger.info(f"Date conversion: {record['fechaAlta']} -> {fecha_alta}, {record['fechaBaja']} -> {fecha_baja}")
-                
-                image_data.append({
-                    "type": "vacation" if record["isVacaciones"] else "contract",
-                    "fechaAlta": fecha_alta,
-                    "fechaBaja": fecha_baja
-                })
-            logger.info(f"Converted to {len(image_data)} image_data records")
+                logger.warning(f"No records extracted from {filename}")
             
-            # Convert image to base64 for preview
-            import base64
-            with open(temp_path, "rb") as img_file:
-                img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
-                logger.info(f"Created base64 image ({len(img_base64)} chars)")
-            
-            image_results.append({
-                "filename": file.filename,
-                "data": image_data,
-                "image_base64": img_base64
-            })
+            duplicate_of = filenames[duplicates[i]['duplicate_of']] if i in duplicates else None
+            image_result = build_image_result(filename, temp_path, records, duplicate_of)
+            image_results.append(image_result)
             
-            all_data.extend(image_data)
+            all_data.extend(image_result["data"])
             logger.info(f"Total data so far: {len(all_data)} records")
             
         except Exception as e:
-            logger.error(f"Error processing {file.filename}: {str(e)}", exc_info=True)
+            logger.error(f"Error processing {filename}: {str(e)}", exc_info=True)
             # Continue with other images even if one fails
             image_results.append({
-                "filename": file.filename,
+                "filename": filename,
                 "data": [],
-                "image_base64": ""
+                "thumbnail_url": None
             })
-            
-        finally:
-            # Clean up temporary file
-            try:
-                os.unlink(temp_path)
-                logger.info(f"Cleaned up temp file: {temp_path}")
-            except Exception as e:
-                logger.warning(f"Could not clean up temp file {temp_path}: {e}")
     
     logger.info(f"=== Image extraction complete. Total records: {len(all_data)} ===")
     
-    return jsonify({
+    return {
         "data": all_data,
         "source": "images",
-        "image_results": image_results
+        "image_results": image_results,
+        "duplicate_images": duplicate_images
+    }
+
+def build_image_result(filename, temp_path, records, duplicate_of=None):
+    """Editor rows and preview of one image"""
+    # Convert OCR format to our format
+    image_data = []
+    for j, record in enumerate(records):
+        logger.info(f"Record {j+1}: {record}")
+        image_data.append(record.to_editor_dict())
+    logger.info(f"Converted to {len(image_data)} image_data records")
+    
+    # The preview is served separately as a cached thumbnail
+    thumbnail_url = f"/thumbnails/{thumbnail_store.add(temp_path)}.jpg"
+    logger.info(f"Preview of {filename} at {thumbnail_url}")
+    
+    image_result = {
+        "filename": filename,
+        "data": image_data,
+        "thumbnail_url": thumbnail_url
+    }
+    if duplicate_of is not None:
+        image_result["duplicate_of"] = duplicate_of
+    return image_result
+
+@app.route('/extract/images/stream', methods=['POST'])
+def stream_image_extraction():
+    """
+    Extract images like /extract, streaming NDJSON: a "start" line, one
+    "image" line per image as soon as its OCR completes and a "done" line.
+    The extraction runs as an extraction job, so it counts against the same
+    limit of pending jobs, and the response relays the events it publishes.
+    """
+    try:
+        upload = save_upload()
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    if upload['source'] != 'images':
+        remove_temp_files(upload['paths'])
+        return jsonify({'error': 'Only images can be streamed'}), 400
+
+    try:
+        job = extraction_jobs.submit(stream_images, upload['filenames'], upload['paths'], events=True)
+    except JobQueueFull as e:
+        remove_temp_files(upload['paths'])
+        logger.warning(f"Image stream rejected: {e}")
+        return jsonify({'error': 'El servidor está ocupado, inténtalo de nuevo en unos minutos'}), 503
+
+    logger.info(f"Streaming extraction job {job.id} ({len(upload['paths'])} images)")
+    return Response(stream_job_events(job.id), mimetype='application/x-ndjson')
+
+def stream_job_events(job_id):
+    """Generator of the NDJSON lines of the events of a job, ending with "done" once it succeeds"""
+    after = 0
+    while True:
+        events, status = extraction_jobs.events(job_id, after)
+        for after, event in events:
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+        if status not in (QUEUED, RUNNING):
+            break
+        time.sleep(STREAM_POLL_INTERVAL)
+    if status == DONE:
+        yield json.dumps({"type": "done"}) + "\n"
+    else:
+        # Without a "done" line the page reports the extraction as interrupted
+        job = extraction_jobs.get(job_id) or {}
+        logger.error(f"Streamed extraction job {job_id} ended as {status}: {job.get('error')}")
+
+def stream_images(filenames, temp_paths, progress, publish):
+    """Extraction job of stream_image_extraction, publishing its "start" and "image" events"""
+    try:
+        duplicates = find_duplicate_images(temp_paths)
+        publish({
+            "type": "start",
+            "filenames": filenames,
+            "duplicate_images": [{
+                "filename": filenames[i],
+                "duplicate_of": filenames[duplicate['duplicate_of']],
+                "distance": duplicate['distance']
+            } for i, duplicate in duplicates.items()]
+        })
+        for i, duplicate in duplicates.items():
+            result = build_image_result(filenames[i], temp_paths[i], [], filenames[duplicate['duplicate_of']])
+            publish({"type": "image", "index": i, **result})
+
+        unique_indexes = [i for i in range(len(temp_paths)) if i not in duplicates]
+        completed = [len(duplicates)]
+        progress(done=completed[0], total=len(temp_paths), stage="ocr")
+
+        def on_result(index, ocr_records, records):
+            i = unique_indexes[index]
+            try:
+                result = build_image_result(filenames[i], temp_paths[i], records)
+            except Exception as e:
+                logger.error(f"Error processing {filenames[i]}: {str(e)}", exc_info=True)
+                result = {"filename": filenames[i], "data": [], "thumbnail_url": None}
+            publish({"type": "image", "index": i, **result})
+            completed[0] += 1
+            progress(done=completed[0])
+
+        # A pipeline error fails the job, so the stream ends without "done"
+        # instead of passing off the images seen so far as the whole result
+        run_ocr_pipeline([temp_paths[i] for i in unique_indexes], on_result=on_result)
+        return {"images": completed[0]}
+    finally:
+        remove_temp_files(temp_paths)
+
+@app.route('/thumbnails/<key>.jpg')
+def thumbnail(key):
+    """Preview of an uploaded image; the URL changes with its content, so it never expires"""
+    path = thumbnail_store.path(key)
+    if path is None:
+        return jsonify({'error': 'Thumbnail not found'}), 404
+    response = send_file(path, mimetype='image/jpeg', etag=key)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/ocr/stats')
+def ocr_stats():
+    """Connection reuse counters of the shared OCR client, OCR cache hits and model tier metrics"""
+    stats = get_ocr_client().stats()
+    cache = get_ocr_cache()
+    stats['cache'] = cache.stats() if cache is not None else None
+    stats['models'] = ocr_tier_stats.stats()
+    stats['extraction_jobs'] = extraction_jobs.stats()
+    return jsonify(stats)
+
+def to_calculation_record(record):
+    """Convert an editor row ({type, fechaAlta, fechaBaja}) to a Record"""
+    return Record.from_dict({
+        "type": record['type'],
+        "fechaAlta": record['fechaAlta'],
+        "fechaBaja": record['fechaBaja']
     })
 
 @app.route('/calculate', methods=['POST'])
@@ -342,13 +393,7 @@ def calculate_vacation_days():
             return jsonify({'error': 'No data provided'}), 400
         
         # Convert user data to the format expected by calculation function
-        formatted_data = []
-        for record in data['records']:
-            formatted_data.append({
-                "isVacaciones": record['type'] == 'vacation',
-                "fechaAlta": record['fechaAlta'],
-                "fechaBaja": record['fechaBaja']
-            })
+        formatted_data = [to_calculation_record(record) for record in data['records']]
         
         # Calculate non-overlapping vacation days
         non_overlapping_vacation_days, vacation_periods = calculate_non_overlapping_vacation_days(formatted_data)
@@ -364,6 +409,100 @@ def calculate_vacation_days():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/calculate/query', methods=['POST'])
+def query_vacation_days():
+    """Answer date-range questions (covered/uncovered vacation days) for one set of records"""
+    try:
+        data = request.get_json()
+        if not data or 'records' not in data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        # The timeline is built once and then answers every range in O(1)
+        timeline = VacationTimeline([to_calculation_record(record) for record in data['records']])
+        ranges = [timeline.query(r.get('start'), r.get('end')) for r in data.get('ranges', [])]
+        ranges.extend(timeline.year(int(year)) for year in data.get('years', []))
+
+        return jsonify({
+            "total_non_overlapping_vacation_days": timeline.uncovered_days(),
+            "ranges": ranges
+        })
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/calculate/session', methods=['POST'])
+def create_calculation_session():
+    """Start an incremental calculation session from the full list of editor rows"""
+    try:
+        data = request.get_json()
+        if not data or 'records' not in data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        # Rows without an id are identified by their position
+        records = [(str(record.get('id', index)), to_calculation_record(record))
+                   for index, record in enumerate(data['records'])]
+        session = CalculationSession(records)
+        session_id = uuid.uuid4().hex
+
+        with calculation_sessions_lock:
+            calculation_sessions[session_id] = session
+            while len(calculation_sessions) > MAX_CALCULATION_SESSIONS:
+                calculation_sessions.popitem(last=False)
+
+            return jsonify({
+                "session_id": session_id,
+                "total_non_overlapping_vacation_days": session.total,
+                "non_overlapping_vacation_periods": session.periods(),
+                "periods_by_row": session.periods_by_row()
+            })
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/calculate/session/<session_id>', methods=['PATCH'])
+def update_calculation_session(session_id):
+    """Apply row-level add/update/delete changes and return only the periods that changed"""
+    try:
+        data = request.get_json()
+        if not data or 'changes' not in data:
+            return jsonify({'error': 'No changes provided'}), 400
+
+        changes = []
+        for change in data['changes']:
+            change = dict(change)
+            if 'record' in change:
+                change['record'] = to_calculation_record(change['record'])
+            changes.append(change)
+
+        with calculation_sessions_lock:
+            session = calculation_sessions.get(session_id)
+            if session is None:
+                return jsonify({'error': 'Unknown calculation session'}), 404
+            calculation_sessions.move_to_end(session_id)
+
+            changed_periods = session.apply(changes)
+            return jsonify({
+                "session_id": session_id,
+                "total_non_overlapping_vacation_days": session.total,
+                "changed_periods": changed_periods
+            })
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/calculate/session/<session_id>', methods=['DELETE'])
+def delete_calculation_session(session_id):
+    """Drop a calculation session"""
+    with calculation_sessions_lock:
+        calculation_sessions.pop(session_id, None)
+    return '', 204
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5010))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""
+Benchmark of the OCR image preprocessing: payload size and encoding time of
+each variant on the sample images and, with --ocr, the accuracy of the
+records the OCR returns for each of them.
+
+Accuracy is the F1 score of the (isVacaciones, fechaAlta, fechaBaja)
+records against --truth (a JSON file mapping image file names to their
+expected records) or, without it, against the records of the legacy
+preprocessing.
+
+    python benchmark_preprocessing.py
+    python benchmark_preprocessing.py --ocr --truth data/imagenes/truth.json
+"""
+import argparse
+import base64
+import json
+import os
+import time
+from collections import Counter
+
+from image_preprocessing import preprocess_image
+from ocr_processor import encode_image_to_base64, process_image_with_ocr
+
+# Variant name -> (target text height, crop to the table) of the adaptive
+# preprocessing, None for the legacy one
+VARIANTS = {
+    "legacy": None,
+    "full-12": (12, False),
+    "table-10": (10, True),
+    "table-12": (12, True),
+    "table-16": (16, True),
+}
+
+
+def encode(image_path, variant):
+    """Return (data_url, payload_bytes, seconds) for one variant."""
+    started = time.perf_counter()
+    if variant is None:
+        base64_image = encode_image_to_base64(image_path)
+        return (f"data:image/jpeg;base64,{base64_image}", len(base64_image),
+                time.perf_counter() - started)
+    target_text_height, crop_table = variant
+    image = preprocess_image(image_path, target_text_height, crop_table=crop_table)
+    base64_image = base64.b64encode(image.data).decode("utf-8")
+    return (f"data:{image.mime_type};base64,{base64_image}", len(base64_image),
+            time.perf_counter() - started)
+
+
+def record_key(record):
+    return (bool(record.get("isVacaciones")), record.get("fechaAlta", ""), record.get("fechaBaja", ""))
+
+
+def f1_score(records, expected):
+    found, wanted = Counter(map(record_key, records)), Counter(map(record_key, expected))
+    matched = sum((found & wanted).values())
+    if not found and not wanted:
+        return 1.0
+    if matched == 0:
+        return 0.0
+    precision = matched / sum(found.values())
+    recall = matched / sum(wanted.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR image preprocessing variants.")
+    parser.add_argument('--images', default='data/imagenes', help='Directory with the sample images')
+    parser.add_argument('--ocr', action='store_true', help='Also run the OCR and measure accuracy (uses the API)')
+    parser.add_argument('--truth', help='JSON file with the expected records of each image')
+    parser.add_argument('--output', default='output/preprocessing_benchmark.json')
+    args = parser.parse_args()
+
+    image_files = sorted(f for f in os.listdir(args.images) if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+    truth = None
+    if args.truth:
+        with open(args.truth, encoding="utf-8") as f:
+            truth = json.load(f)
+
+    results = []
+    for image_file in image_files:
+        image_path = os.path.join(args.images, image_file)
+        reference = truth.get(image_file) if truth else None
+
+        for variant, settings in VARIANTS.items():
+            image_url, payload_bytes, seconds = encode(image_path, settings)
+            result = {"image": image_file, "variant": variant,
+                      "payload_bytes": payload_bytes, "seconds": round(seconds, 3)}
+            if args.ocr:
+                records = process_image_with_ocr(image_path, image_url=image_url)
+                if reference is None and variant == "legacy":
+                    reference = records
+                result["records"] = len(records)
+                result["f1"] = round(f1_score(records, reference), 3)
+            results.append(result)
+            print(f"{image_file[:40]:40s} {variant:12s} {payload_bytes / 1024:9.0f} KB "
+                  f"{seconds:6.2f}s" + (f"  F1 {result['f1']:.3f}" if args.ocr else ""))
+
+    print("\n=== SUMMARY ===")
+    for variant in VARIANTS:
+        rows = [r for r in results if r["variant"] == variant]
+        if not rows:
+            continue
+        line = (f"{variant:12s} {sum(r['payload_bytes'] for r in rows) / len(rows) / 1024:9.0f} KB/image "
+                f"{sum(r['seconds'] for r in rows) / len(rows):6.2f}s/image")
+        if args.ocr:
+            line += f"  mean F1 {sum(r['f1'] for r in rows) / len(rows):.3f}"
+        print(line)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nResults saved as: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Incremental vacation calculation for the web editor.
+
+A CalculationSession keeps the parsed records of one user together with an
+interval tree over contracts and another one over vacations. Row-level
+add/update/delete changes only recompute the vacations whose range touches
+the changed interval instead of re-running the whole calculation.
+"""
+import datetime
+import random
+
+from records import format_ordinal
+from vacation_calculator import merge_intervals, parse_record, subtract_coverage
+
+
+class _Node:
+    __slots__ = ("key", "row_id", "start", "end", "max_end", "priority", "left", "right")
+
+    def __init__(self, key, row_id, start, end):
+        self.key = key
+        self.row_id = row_id
+        self.start = start
+        self.end = end
+        self.max_end = end
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+
+
+def _update(node):
+    node.max_end = node.end
+    if node.left is not None and node.left.max_end > node.max_end:
+        node.max_end = node.left.max_end
+    if node.right is not None and node.right.max_end > node.max_end:
+        node.max_end = node.right.max_end
+
+
+def _split(node, key):
+    """Split a treap into the nodes with a key < key and the ones >= key."""
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        _update(node)
+        return node, right
+    left, node.left = _split(node.left, key)
+    _update(node)
+    return left, node
+
+
+def _merge(left, right):
+    """Merge two treaps where every key in left is smaller than in right."""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+class IntervalTree:
+    """
+    Inclusive (start, end) intervals identified by a row id.
+
+    Implemented as a treap ordered by start date and augmented with the
+    maximum end date of every subtree, so insertions and deletions are
+    O(log n) and overlap queries are O(log n + k).
+    """
+
+    def __init__(self):
+        self._root = None
+        self._keys = {}
+        self._sequence = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, row_id):
+        return row_id in self._keys
+
+    def add(self, row_id, start, end):
+        if row_id in self._keys:
+            self.remove(row_id)
+        # The sequence number keeps keys unique for identical intervals
+        self._sequence += 1
+        key = (start, end, self._sequence)
+        self._keys[row_id] = key
+        left, right = _split(self._root, key)
+        self._root = _merge(_merge(left, _Node(key, row_id, start, end)), right)
+
+    def remove(self, row_id):
+        key = self._keys.pop(row_id)
+        left, rest = _split(self._root, key)
+        _, right = _split(rest, (key[0], key[1], key[2] + 1))
+        self._root = _merge(left, right)
+
+    def overlapping(self, start, end):
+        """Return (start, end, row_id) for every interval touching [start, end]."""
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end < start:
+                continue
+            stack.append(node.left)
+            # Everything to the right starts even later
+            if node.start <= end:
+                if node.end >= start:
+                    found.append((node.start, node.end, node.row_id))
+                stack.append(node.right)
+        return found
+
+
+class CalculationSession:
+    """
+    Calculation state for one editing session.
+
+    Rows are identified by the ids the client assigns to them and keep their
+    insertion order, so the full period list matches what
+    calculate_non_overlapping_vacation_days returns for the same rows.
+    """
+
+    def __init__(self, records=None, today=None):
+        if today is None:
+            today = datetime.date.today().toordinal()
+        self.today = today
+        self.total = 0
+        self._rows = {}
+        self._segments = {}
+        self._contracts = IntervalTree()
+        self._vacations = IntervalTree()
+        if records:
+            self.apply([{"op": "add", "id": row_id, "record": record}
+                        for row_id, record in records])
+
+    def apply(self, changes):
+        """
+        Apply a list of {"op": "add"|"update"|"delete", "id": ..., "record": ...}
+        changes and return {row_id: periods} for the vacations whose
+        non-overlapping periods changed. Removed vacations map to [].
+        """
+        self._validate(changes)
+        previous = {}
+        dirty = set()
+
+        for change in changes:
+            op = change["op"]
+            row_id = str(change["id"])
+            previous.setdefault(row_id, self._segments.get(row_id, []))
+            if op != "add":
+                dirty.update(self._remove_row(row_id))
+            if op == "delete":
+                del self._rows[row_id]
+            else:
+                dirty.update(self._add_row(row_id, change["record"]))
+
+        for row_id in dirty:
+            if row_id in self._vacations:
+                previous.setdefault(row_id, self._segments.get(row_id, []))
+                self._recompute_vacation(row_id)
+
+        changed = {}
+        for row_id, old_segments in previous.items():
+            new_segments = self._segments.get(row_id, [])
+            if new_segments != old_segments:
+                changed[row_id] = self._format(new_segments)
+        return changed
+
+    def _validate(self, changes):
+        """Check a whole list of changes before applying any of them."""
+        row_ids = set(self._rows)
+        for change in changes:
+            op = change.get("op")
+            row_id = str(change.get("id"))
+            if op not in ("add", "update", "delete"):
+                raise ValueError(f"Unknown operation {op}")
+            if op == "add" and row_id in row_ids:
+                raise ValueError(f"Row {row_id} already exists")
+            if op != "add" and row_id not in row_ids:
+                raise ValueError(f"Unknown row {row_id}")
+            if op != "delete" and change.get("record") is None:
+                raise ValueError(f"Missing record for row {row_id}")
+
+            if op == "delete":
+                row_ids.discard(row_id)
+            else:
+                row_ids.add(row_id)
+
+    def periods(self):
+        """All non-overlapping periods, in row order."""
+        return [period for row_id in self._rows
+                for period in self._format(self._segments.get(row_id, []))]
+
+    def periods_by_row(self):
+        return {row_id: self._format(segments) for row_id, segments in self._segments.items()}
+
+    def _add_row(self, row_id, record):
+        """Store a row and return the vacations that must be recomputed."""
+        # Updated rows are stored in place so they keep their position
+        parsed = parse_record(record, self.today)
+        self._rows[row_id] = parsed
+        if parsed is None:
+            return []
+
+        is_vacation, start, end = parsed
+        if is_vacation:
+            self._vacations.add(row_id, start, end)
+            return [row_id]
+        self._contracts.add(row_id, start, end)
+        return [vacation_id for _, _, vacation_id in self._vacations.overlapping(start, end)]
+
+    def _remove_row(self, row_id):
+        """Drop a row's intervals and return the vacations that must be recomputed."""
+        parsed = self._rows[row_id]
+        if parsed is None:
+            return []
+
+        is_vacation, start, end = parsed
+        if is_vacation:
+            self._vacations.remove(row_id)
+            self.total -= sum(e - s + 1 for s, e in self._segments.pop(row_id, []))
+            return []
+        self._contracts.remove(row_id)
+        return [vacation_id for _, _, vacation_id in self._vacations.overlapping(start, end)]
+
+    def _recompute_vacation(self, row_id):
+        _, start, end = self._rows[row_id]
+        coverage = merge_intervals(
+            (max(s, start), min(e, end)) for s, e, _ in self._contracts.overlapping(start, end))
+        segments = subtract_coverage([(start, end, 0)], coverage)[0]
+
+        self.total -= sum(e - s + 1 for s, e in self._segments.get(row_id, []))
+        self.total += sum(e - s + 1 for s, e in segments)
+        self._segments[row_id] = segments
+
+    @staticmethod
+    def _format(segments):
+        return [{"start": format_ordinal(s), "end": format_ordinal(e), "days": e - s + 1}
+                for s, e in segments]
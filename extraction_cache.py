@@ -0,0 +1,154 @@
+"""
+Disk cache of extracted SITUACIONES tables.
+
+Entries are content-addressed: the key is the SHA-256 of the PDF bytes
+together with the extractor version, backend and page spec, so uploading the
+same vida laboral again skips the extraction and any change to the
+extractor invalidates old entries. The cache is bounded in size and evicts
+the least recently used entries first. Concurrent requests for the same key
+within a process wait for a single extraction instead of repeating it.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import pandas as pd
+
+from pdf_extractor import EXTRACTOR_VERSION, extract_situaciones
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+
+def cache_key(pdf_path, backend, pages="auto"):
+    """SHA-256 of the file bytes plus everything that changes the extracted table."""
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    digest.update(f"\0{EXTRACTOR_VERSION}\0{backend}\0{pages}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ExtractionCache:
+    """
+    Size-bounded LRU cache of extraction results stored as one JSON file
+    per key. Recency is tracked with the file modification time, which is
+    refreshed on every hit.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._flights = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """Cached DataFrame for a key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return pd.DataFrame(entry["rows"], columns=entry["columns"] or None)
+
+    def put(self, key, df):
+        entry = {"columns": list(df.columns), "rows": df.values.tolist()}
+        # Write to a temporary file first so readers never see half an entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, self._path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def extract(self, pdf_path, pages="auto", backend="camelot", workers=None):
+        """
+        extract_situaciones through the cache.
+        Returns (df, cached) where cached tells whether the extraction was skipped.
+        """
+        key = cache_key(pdf_path, backend, pages)
+
+        with self._lock:
+            df = self.get(key)
+            if df is not None:
+                self.hits += 1
+                return df, True
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            # Another request is already extracting the same file
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            with self._lock:
+                self.hits += 1
+            return flight.result.copy(), True
+
+        try:
+            df = extract_situaciones(pdf_path, pages=pages, backend=backend, workers=workers)
+            with self._lock:
+                self.misses += 1
+                try:
+                    self.put(key, df)
+                except OSError as e:
+                    # The extraction itself succeeded, it just won't be cached
+                    logger.warning(f"Could not cache the extraction of {pdf_path}: {e}")
+            flight.result = df
+            return df, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
@@ -0,0 +1,223 @@
+"""
+Background extraction jobs for the web app.
+
+A PDF or a batch of photos can take minutes to extract, longer than a
+proxy will keep a request open. POST /extract/jobs queues the extraction
+on a bounded pool of worker threads and returns a job id at once; clients
+then poll the job for its status, its progress and finally its result.
+
+Several app.py processes may serve the same clients, so a poll can reach a
+process other than the one running the job. Job state is therefore kept in
+a SQLite database every process opens (like rate_limiter.py): each process
+runs the jobs submitted to it and writes their progress and result there.
+Processes refresh the jobs they own every few seconds; queued or running
+jobs that stop being refreshed belong to a process that died and are
+reported as failed. Finished jobs are kept for a while so their result can
+be fetched, and the oldest are dropped once there are too many.
+
+A job can also publish events while it runs (the streamed image extraction
+sends one per image); they are stored in order next to the job and read
+back with events().
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# Seconds between refreshes of the jobs a process owns, and without one
+# before a queued or running job is considered lost
+HEARTBEAT_INTERVAL = 5
+STALE_JOB = 60
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class ExtractionJob:
+    """Handle of a job run by this process; progress is written through to the database."""
+
+    def __init__(self, jobs, job_id):
+        self.jobs = jobs
+        self.id = job_id
+
+    def set_progress(self, done=None, total=None, stage=None):
+        """Progress callback handed to the extraction function."""
+        updates = {name: value for name, value in (("done", done), ("total", total), ("stage", stage))
+                   if value is not None}
+        if updates:
+            self.jobs._update(self.id, **updates)
+
+    def publish(self, event):
+        """Append a JSON serializable event to the job's events."""
+        with self.jobs._transaction() as db:
+            db.execute("INSERT INTO events (job_id, event) VALUES (?, ?)",
+                       (self.id, json.dumps(event, ensure_ascii=False)))
+
+    def to_dict(self):
+        return self.jobs.get(self.id)
+
+
+class ExtractionJobs:
+    """
+    Registry of extraction jobs stored in the SQLite database at path and
+    run by max_workers threads of each process. At most max_pending jobs
+    may be queued or running across all processes; submit raises
+    JobQueueFull beyond that. Only the last max_jobs jobs are kept.
+    """
+
+    def __init__(self, path, max_workers=2, max_pending=20, max_jobs=200):
+        self.path = path
+        self.max_pending = max_pending
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extraction-job")
+        self._owned = set()
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, "
+                       "stage TEXT, done INTEGER NOT NULL DEFAULT 0, total INTEGER, result TEXT, error TEXT, "
+                       "created REAL NOT NULL, finished REAL, updated REAL NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                       "job_id TEXT NOT NULL, event TEXT NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS events_job ON events (job_id, seq)")
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            # IMMEDIATE takes the write lock up front, so counting the
+            # pending jobs and adding one can't interleave with another process
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def _fail_lost_jobs(self, db, now):
+        db.execute("UPDATE jobs SET status = ?, error = ?, finished = ? "
+                   "WHERE status IN (?, ?) AND updated < ?",
+                   (FAILED, "The server stopped while running this job", now, QUEUED, RUNNING, now - STALE_JOB))
+
+    def _update(self, job_id, **columns):
+        columns["updated"] = time.time()
+        with self._transaction() as db:
+            db.execute(f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in columns)} WHERE id = ?",
+                       (*columns.values(), job_id))
+
+    def submit(self, func, *args, events=False):
+        """
+        Queue func(*args, progress=job.set_progress), also passing
+        publish=job.publish if events is true; its return value (JSON
+        serializable) becomes the job result. Returns the job.
+        """
+        job = ExtractionJob(self, uuid.uuid4().hex)
+        with self._transaction() as db:
+            now = time.time()
+            self._fail_lost_jobs(db, now)
+            pending = db.execute("SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchone()[0]
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} extraction jobs are already pending")
+            db.execute("INSERT INTO jobs (id, status, created, updated) VALUES (?, ?, ?, ?)",
+                       (job.id, QUEUED, now, now))
+            # Drop the oldest finished jobs
+            db.execute("DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE status IN (?, ?) "
+                       "ORDER BY created DESC LIMIT -1 OFFSET ?)", (DONE, FAILED, self.max_jobs))
+            db.execute("DELETE FROM events WHERE job_id NOT IN (SELECT id FROM jobs)")
+        with self._lock:
+            self._owned.add(job.id)
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._refresh_owned, name="extraction-job-heartbeat",
+                                                   daemon=True)
+                self._heartbeat.start()
+        self._executor.submit(self._run, job, func, args, events)
+        return job
+
+    def _refresh_owned(self):
+        """Mark the jobs of this process as alive, so other processes don't fail them."""
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._lock:
+                owned = list(self._owned)
+            if not owned:
+                continue
+            try:
+                with self._transaction() as db:
+                    db.executemany("UPDATE jobs SET updated = ? WHERE id = ?",
+                                   [(time.time(), job_id) for job_id in owned])
+            except sqlite3.Error:
+                pass
+
+    def _run(self, job, func, args, events):
+        try:
+            self._update(job.id, status=RUNNING)
+            kwargs = {"progress": job.set_progress}
+            if events:
+                kwargs["publish"] = job.publish
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self._update(job.id, status=FAILED, error=str(e), finished=time.time())
+            else:
+                self._update(job.id, status=DONE, result=json.dumps(result, ensure_ascii=False),
+                             finished=time.time())
+        finally:
+            with self._lock:
+                self._owned.discard(job.id)
+
+    def get(self, job_id):
+        """Status, progress, elapsed seconds and result or error of a job, or None if unknown."""
+        with self._transaction() as db:
+            self._fail_lost_jobs(db, time.time())
+            row = db.execute("SELECT status, stage, done, total, result, error, created, finished "
+                             "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        status, stage, done, total, result, error, created, finished = row
+        job = {
+            "job_id": job_id,
+            "status": status,
+            "progress": {"done": done, "total": total, "stage": stage},
+            "seconds": round((finished or time.time()) - created, 1)
+        }
+        if status == DONE:
+            job["result"] = json.loads(result)
+        elif status == FAILED:
+            job["error"] = error
+        return job
+
+    def events(self, job_id, after=0):
+        """
+        Events the job published after sequence number after, as a list of
+        (seq, event), and the job status (None if unknown). All events are
+        published before the status turns done or failed.
+        """
+        with self._transaction() as db:
+            self._fail_lost_jobs(db, time.time())
+            row = db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            rows = db.execute("SELECT seq, event FROM events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                              (job_id, after)).fetchall()
+        return [(seq, json.loads(event)) for seq, event in rows], row[0] if row else None
+
+    def stats(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        finally:
+            db.close()
+        return {status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)}
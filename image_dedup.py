@@ -0,0 +1,63 @@
+"""
+Near-duplicate detection of uploaded photos before OCR.
+
+Each image gets a 256-bit difference hash (dHash) of a 17x16 grayscale
+thumbnail: one bit per pair of horizontally adjacent pixels telling whether
+brightness increases. The hash survives recompression, resizing, small
+crops and brightness changes, so the same page sent twice (e.g. forwarded
+again through WhatsApp, or a screenshot of it) stays within MAX_DISTANCE
+bits, while different pages of the same vida laboral, which share the whole
+layout, differ in 60 bits or more. Re-photographing a page from another angle is not caught.
+"""
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image, ImageOps
+
+HASH_SIZE = 16
+# Largest Hamming distance (out of HASH_SIZE**2 bits) between two images
+# considered the same page
+MAX_DISTANCE = 45
+
+
+def image_hash(image_path: str) -> int:
+    """Difference hash of an image as a HASH_SIZE**2-bit integer."""
+    with Image.open(image_path) as img:
+        # JPEG draft mode decodes at a reduced scale, far faster than a full decode
+        img.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+        img = ImageOps.exif_transpose(img).convert("L")
+        thumb = np.asarray(img.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS), dtype=np.int16)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).ravel()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hash_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def find_near_duplicates(image_paths: List[str], max_distance: int = MAX_DISTANCE) -> Dict[int, Dict]:
+    """
+    Group near-duplicate images. Returns {index: {"duplicate_of": index,
+    "distance": bits}} for every image that repeats an earlier one; the
+    first image of each group is kept and is not in the result. Images that
+    can't be read are never treated as duplicates.
+    """
+    hashes = []
+    duplicates = {}
+    for i, path in enumerate(image_paths):
+        try:
+            hashes.append(image_hash(path))
+        except (OSError, ValueError):
+            hashes.append(None)
+            continue
+
+        best = None
+        for j in range(i):
+            if hashes[j] is None or j in duplicates:
+                continue
+            distance = hash_distance(hashes[i], hashes[j])
+            if distance <= max_distance and (best is None or distance < best[1]):
+                best = (j, distance)
+        if best is not None:
+            duplicates[i] = {"duplicate_of": best[0], "distance": best[1]}
+    return duplicates
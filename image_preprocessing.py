@@ -0,0 +1,338 @@
+"""
+Adaptive preprocessing of document photos before OCR.
+
+Instead of always upscaling to 2000px, enhancing and saving a quality-98
+JPEG, the image is measured first and only gets what it needs:
+
+- the photo is deskewed and cropped to the SITUACIONES table (with OpenCV,
+  when available), dropping margins, page headers and the desk around it,
+- the resolution is chosen so the text ends up about TARGET_TEXT_HEIGHT
+  pixels tall,
+- the image becomes grayscale when the text itself has no colour,
+- blurry or low-contrast photos are sharpened or stretched,
+- clean scans with few grey levels are saved as PNG, photos as JPEG with a
+  quality that depends on the sharpness.
+"""
+import io
+import time
+from typing import Dict
+
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+
+# Height in pixels of the capital letters after resizing, as measured by estimate_text_height
+TARGET_TEXT_HEIGHT = 12
+MAX_WIDTH = 2000
+MIN_WIDTH = 800
+
+# Images are measured at this width so the thresholds don't depend on the resolution
+MEASURE_WIDTH = 1500
+# Variance of the Laplacian below which a photo is considered blurry
+BLURRY_SHARPNESS = 400
+# Median chroma of the text pixels (after white balance) above which colour is kept
+COLOR_TEXT_CHROMA = 20
+# Contrast range (2nd to 98th percentile) below which the levels are stretched
+LOW_CONTRAST_RANGE = 150
+# Fraction of mid-tone pixels below which the image is treated as a clean scan
+SCAN_MIDTONES = 0.05
+
+JPEG_QUALITY = 80
+JPEG_QUALITY_BLURRY = 88
+
+# Table detection runs at this width
+DETECT_WIDTH = 1000
+# Skew angles (degrees) considered when deskewing
+MAX_SKEW = 15
+# Detected tables smaller than this fraction of the photo are ignored
+MIN_TABLE_AREA = 0.15
+# Margin kept around the detected table, as a fraction of its size
+TABLE_MARGIN = 0.015
+
+# Tiling of tall tables: table rows per band, rows shared by consecutive
+# bands, and the height of a table row in text heights
+BAND_ROWS = 12
+BAND_OVERLAP_ROWS = 1.5
+ROW_PITCH = 3.3
+
+
+class PreprocessedImage:
+    """Encoded image ready for the OCR request, with its measurements and timing."""
+    __slots__ = ("data", "mime_type", "width", "height", "settings", "seconds")
+
+    def __init__(self, data, mime_type, width, height, settings, seconds):
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        self.settings = settings
+        self.seconds = seconds
+
+    @property
+    def payload_bytes(self):
+        """Size of the base64 payload sent to the API."""
+        return (len(self.data) + 2) // 3 * 4
+
+    def report(self) -> Dict:
+        return dict(self.settings, width=self.width, height=self.height,
+                    mime_type=self.mime_type, payload_bytes=self.payload_bytes,
+                    seconds=round(self.seconds, 3))
+
+
+def _otsu_threshold(gray):
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    p = hist / hist.sum()
+    weight = np.cumsum(p)
+    mean = np.cumsum(p * np.arange(256))
+    between = (mean[-1] * weight - mean) ** 2 / (weight * (1 - weight) + 1e-12)
+    return int(np.argmax(between))
+
+
+def estimate_text_height(ink):
+    """
+    Estimate the height of the capital letters from the vertical runs of
+    ink pixels: most long runs are the stems of letters and digits, while
+    table rules are much longer and are left out.
+    """
+    columns = np.pad(ink.T, ((0, 0), (1, 1))).astype(np.int8)
+    edges = np.diff(columns, axis=1)
+    lengths = np.nonzero(edges == -1)[1] - np.nonzero(edges == 1)[1]
+    lengths = lengths[(lengths >= 2) & (lengths <= ink.shape[0] // 20)]
+    if lengths.size == 0:
+        return None
+    return float(np.percentile(lengths, 90))
+
+
+def _page_box(paper):
+    """Rows and columns that are mostly paper, leaving out the table or sofa around the page."""
+    rows = np.nonzero(paper.mean(axis=1) > 0.6)[0]
+    cols = np.nonzero(paper.mean(axis=0) > 0.6)[0]
+    if rows.size == 0 or cols.size == 0:
+        return slice(None), slice(None)
+    return slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1)
+
+
+def measure_image(img: Image.Image) -> Dict:
+    """Text height (at full resolution), sharpness, contrast and colour of a photo."""
+    scale = min(1.0, MEASURE_WIDTH / img.width)
+    small = img.convert("RGB")
+    if scale < 1.0:
+        small = small.resize((round(img.width * scale), round(img.height * scale)), Image.BILINEAR)
+    gray = np.asarray(small.convert("L"))
+    threshold = _otsu_threshold(gray)
+
+    box = _page_box(gray >= threshold)
+    gray = gray[box]
+    rgb = np.asarray(small, dtype=np.float64)[box]
+    ink = gray < threshold
+    text_height = estimate_text_height(ink)
+
+    g = gray.astype(np.float64)
+    laplacian = 4 * g[1:-1, 1:-1] - g[:-2, 1:-1] - g[2:, 1:-1] - g[1:-1, :-2] - g[1:-1, 2:]
+    low, high = np.percentile(gray, [2, 98])
+
+    # Chroma of the darker half of the ink once the paper is made neutral,
+    # so warm lighting or highlighter marks don't count as coloured text
+    text_chroma = 0.0
+    if ink.any() and (~ink).any():
+        paper_color = np.median(rgb[~ink], axis=0)
+        balanced = rgb * (paper_color.mean() / np.maximum(paper_color, 1))
+        chroma = balanced.max(axis=2) - balanced.min(axis=2)
+        text = ink & (gray < np.median(gray[ink]))
+        if text.any():
+            text_chroma = float(np.median(chroma[text]))
+
+    return {
+        "text_height": None if text_height is None else text_height / scale,
+        "sharpness": float(laplacian.var()),
+        "contrast": float(high - low),
+        "text_chroma": text_chroma,
+        "midtones": float(np.mean((gray > 64) & (gray < 192))),
+    }
+
+
+def _line_masks(gray, cv2):
+    """Horizontal and vertical ruling lines of a grayscale image."""
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+    height, width = binary.shape
+    horizontal = cv2.morphologyEx(binary, cv2.MORPH_OPEN,
+                                  cv2.getStructuringElement(cv2.MORPH_RECT, (width // 25, 1)))
+    vertical = cv2.morphologyEx(binary, cv2.MORPH_OPEN,
+                                cv2.getStructuringElement(cv2.MORPH_RECT, (1, height // 40)))
+    return horizontal, vertical
+
+
+def _skew_angle(horizontal, cv2):
+    """Median angle in degrees of the long horizontal rules."""
+    width = horizontal.shape[1]
+    segments = cv2.HoughLinesP(horizontal, 1, np.pi / 1800, threshold=width // 10,
+                               minLineLength=width // 4, maxLineGap=10)
+    if segments is None:
+        return 0.0
+    x1, y1, x2, y2 = segments.reshape(-1, 4).T.astype(np.float64)
+    angles = np.degrees(np.arctan2(y2 - y1, x2 - x1))
+    angles = angles[np.abs(angles) < MAX_SKEW]
+    return float(np.median(angles)) if angles.size else 0.0
+
+
+def crop_to_table(img: Image.Image):
+    """
+    Deskew a photo by its table rules and crop it to the largest ruled
+    region. Returns (image, details) where details has the "skew" angle and
+    the "crop" box, or (img, None) when OpenCV isn't installed or no table
+    is found.
+    """
+    try:
+        import cv2  # installed with camelot-py[cv]
+    except ImportError:
+        return img, None
+
+    rgb = np.asarray(img.convert("RGB"))
+    height, width = rgb.shape[:2]
+    scale = min(1.0, DETECT_WIDTH / width)
+
+    def detection_gray(image):
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+
+    angle = _skew_angle(_line_masks(detection_gray(rgb), cv2)[0], cv2)
+    if angle:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        rgb = cv2.warpAffine(rgb, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                             borderMode=cv2.BORDER_REPLICATE)
+
+    # The table is the largest block of connected ruling lines
+    gray = detection_gray(rgb)
+    horizontal, vertical = _line_masks(gray, cv2)
+    grid = cv2.dilate(horizontal | vertical, np.ones((5, 5), np.uint8))
+    contours, _ = cv2.findContours(grid, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return img, None
+    x, y, w, h = max((cv2.boundingRect(c) for c in contours), key=lambda r: r[2] * r[3])
+    if w * h < MIN_TABLE_AREA * gray.size:
+        return img, None
+
+    margin_x, margin_y = w * TABLE_MARGIN, h * TABLE_MARGIN
+    box = (max(0, int((x - margin_x) / scale)), max(0, int((y - margin_y) / scale)),
+           min(width, int((x + w + margin_x) / scale)), min(height, int((y + h + margin_y) / scale)))
+    cropped = Image.fromarray(rgb[box[1]:box[3], box[0]:box[2]])
+    return cropped, {"skew": round(angle, 2), "crop": box}
+
+
+def choose_settings(img: Image.Image, measures: Dict, target_text_height: float = TARGET_TEXT_HEIGHT) -> Dict:
+    if measures["text_height"]:
+        scale = target_text_height / measures["text_height"]
+    else:
+        scale = 1.0
+    width = min(max(img.width * scale, MIN_WIDTH), MAX_WIDTH, img.width * 2)
+    blurry = measures["sharpness"] < BLURRY_SHARPNESS
+    scan = measures["midtones"] < SCAN_MIDTONES
+    return {
+        "scale": round(width / img.width, 3),
+        "grayscale": measures["text_chroma"] < COLOR_TEXT_CHROMA,
+        "sharpen": blurry,
+        "autocontrast": measures["contrast"] < LOW_CONTRAST_RANGE,
+        "format": "PNG" if scan else "JPEG",
+        "quality": JPEG_QUALITY_BLURRY if blurry else JPEG_QUALITY,
+    }
+
+
+def _prepare_image(img: Image.Image, target_text_height: float, crop_table: bool):
+    """Crop, measure and adapt an opened image; returns (image, settings) before encoding."""
+    img = ImageOps.exif_transpose(img)
+    table = None
+    if crop_table:
+        img, table = crop_to_table(img)
+    measures = measure_image(img)
+    settings = choose_settings(img, measures, target_text_height)
+    settings["table"] = table
+
+    img = img.convert("L" if settings["grayscale"] else "RGB")
+    if settings["scale"] != 1.0:
+        size = (round(img.width * settings["scale"]), round(img.height * settings["scale"]))
+        img = img.resize(size, Image.LANCZOS if settings["scale"] > 1 else Image.BICUBIC)
+    if settings["autocontrast"]:
+        img = ImageOps.autocontrast(img, cutoff=1)
+    if settings["sharpen"]:
+        img = img.filter(ImageFilter.UnsharpMask(radius=1, percent=150, threshold=3))
+
+    text_height = measures["text_height"]
+    settings["text_height"] = None if text_height is None else round(text_height, 1)
+    settings["sharpness"] = round(measures["sharpness"])
+    return img, settings
+
+
+def _encode(img: Image.Image, settings: Dict, started: float) -> PreprocessedImage:
+    buffer = io.BytesIO()
+    if settings["format"] == "PNG":
+        img.save(buffer, format="PNG", optimize=True)
+        mime_type = "image/png"
+    else:
+        img.save(buffer, format="JPEG", quality=settings["quality"], optimize=True)
+        mime_type = "image/jpeg"
+    return PreprocessedImage(buffer.getvalue(), mime_type, img.width, img.height, settings,
+                             time.perf_counter() - started)
+
+
+def preprocess_image(image_path: str, target_text_height: float = TARGET_TEXT_HEIGHT,
+                     crop_table: bool = True) -> PreprocessedImage:
+    """Crop, measure, adapt and encode an image for OCR."""
+    started = time.perf_counter()
+    with Image.open(image_path) as img:
+        img, settings = _prepare_image(img, target_text_height, crop_table)
+    return _encode(img, settings, started)
+
+
+def band_bounds(img: Image.Image, text_height: float, band_rows: float = BAND_ROWS,
+                overlap_rows: float = BAND_OVERLAP_ROWS):
+    """
+    (top, bottom) pixel rows of overlapping horizontal bands of about
+    band_rows table rows each. Cuts are moved to the emptiest pixel row
+    nearby so they fall between table rows rather than through the text.
+    """
+    pitch = text_height * ROW_PITCH
+    band, overlap = band_rows * pitch, overlap_rows * pitch
+    height = img.height
+    if height <= band * 1.5:
+        return [(0, height)]
+
+    gray = np.asarray(img.convert("L"))
+    ink = (gray < _otsu_threshold(gray)).mean(axis=1)
+
+    def snap(row):
+        low, high = max(0, int(row - pitch / 2)), min(height, int(row + pitch / 2) + 1)
+        return low + int(np.argmin(ink[low:high]))
+
+    bounds, top = [], 0
+    while True:
+        if top + band * 1.5 >= height:
+            bounds.append((top, height))
+            return bounds
+        bottom = snap(top + band)
+        bounds.append((top, bottom))
+        top = max(snap(bottom - overlap), top + 1)
+
+
+def preprocess_bands(image_path: str, target_text_height: float = TARGET_TEXT_HEIGHT,
+                     crop_table: bool = True, band_rows: float = BAND_ROWS):
+    """
+    preprocess_image split into overlapping row bands, top to bottom, so a
+    tall table can be read as several short OCR requests. Each band's
+    settings include its "band" (top, bottom) rows in the adapted image.
+    """
+    started = time.perf_counter()
+    with Image.open(image_path) as img:
+        img, settings = _prepare_image(img, target_text_height, crop_table)
+    preparation = time.perf_counter() - started
+
+    if settings["text_height"]:
+        text_height = settings["text_height"] * settings["scale"]
+    else:
+        text_height = target_text_height
+    bands = []
+    for top, bottom in band_bounds(img, text_height, band_rows):
+        band_started = time.perf_counter()
+        bands.append(_encode(img.crop((0, top, img.width, bottom)),
+                             dict(settings, band=(top, bottom)), band_started))
+    # The shared preparation time is counted in the first band
+    bands[0].seconds += preparation
+    return bands
@@ -0,0 +1,136 @@
+"""
+Load test of the OCR path against the local OpenRouter stand-in
+(mock_openrouter.py): runs process_all_images and the /extract images route
+for a number of rounds and reports images/sec, p50/p95 request latency and
+the retries caused by errors and 429 bursts.
+
+    python load_test_ocr.py
+    python load_test_ocr.py --rounds 5 --latency 2 --error-rate 0.1 --burst-every 20 --burst-length 3
+    python load_test_ocr.py --url http://127.0.0.1:8765/api/v1/chat/completions
+
+The OCR cache is disabled so every round reaches the server, and the shared
+OCR rate limit is off so the latencies are those of the server and the run
+doesn't use up the budget of the app on the same host. --rate-limit tests
+the limiter with a private database; its waits are reported apart.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from mock_openrouter import start_mock_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the OCR path against a local mock of OpenRouter.")
+    parser.add_argument('--images', default='data/imagenes', help='Directory with the images to OCR')
+    parser.add_argument('--rounds', type=int, default=3, help='Times each route processes the images')
+    parser.add_argument('--routes', default='cli,extract', help='Comma separated: cli (process_all_images), extract (/extract)')
+    parser.add_argument('--url', help='Use an already running mock instead of starting one')
+    parser.add_argument('--latency', type=float, default=1.0, help='Mean seconds per mock request')
+    parser.add_argument('--jitter', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of mock requests answered with 500')
+    parser.add_argument('--invalid-rate', type=float, default=0.0, help='Share of mock records with an invalid date')
+    parser.add_argument('--burst-every', type=float, default=0.0, help='Seconds between 429 bursts')
+    parser.add_argument('--burst-length', type=float, default=0.0, help='Seconds each 429 burst lasts')
+    parser.add_argument('--rate-limit', type=float, default=0.0,
+                        help='OCR requests per second through a private rate limiter (0: no limit)')
+    parser.add_argument('--output', default='output/ocr_load_test.json')
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        url = args.url
+    else:
+        server = start_mock_server(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                   invalid_rate=args.invalid_rate, burst_every=args.burst_every,
+                                   burst_length=args.burst_length)
+        url = server.url
+    print(f"OCR requests go to {url}")
+
+    # Read by ocr_processor at import time
+    os.environ['OPENROUTER_URL'] = url
+    os.environ['OPENROUTER_API_KEY'] = 'mock'
+    os.environ['OCR_CACHE_DIR'] = ''
+    os.environ['OCR_RATE_LIMIT'] = str(args.rate_limit)
+    if args.rate_limit:
+        os.environ['OCR_RATE_LIMIT_DB'] = os.path.join(tempfile.mkdtemp(), 'ocr_rate_limit.sqlite3')
+    from ocr_processor import get_ocr_client, ocr_tier_stats, percentile, process_all_images
+
+    image_files = sorted(f for f in os.listdir(args.images) if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+    if not image_files:
+        print(f"No images in {args.images}")
+        sys.exit(1)
+    client = get_ocr_client()
+
+    def run_extract_route():
+        from app import app
+        files = [(open(os.path.join(args.images, name), 'rb'), name) for name in image_files]
+        try:
+            response = app.test_client().post('/extract', data={'images': files},
+                                              content_type='multipart/form-data')
+        finally:
+            for f, _ in files:
+                f.close()
+        if response.status_code != 200:
+            raise RuntimeError(f"/extract returned {response.status_code}: {response.get_json()}")
+
+    routes = {
+        "cli": lambda: process_all_images(args.images),
+        "extract": run_extract_route,
+    }
+
+    results = []
+    for route in args.routes.split(','):
+        route = route.strip()
+        if route not in routes:
+            parser.error(f"Unknown route: {route}")
+        for round_number in range(1, args.rounds + 1):
+            retries_before = client.retries
+            client.latencies.clear()
+            client.limiter_waits.clear()
+            started = time.perf_counter()
+            routes[route]()
+            seconds = time.perf_counter() - started
+            latencies = sorted(client.latencies)
+            waits = sorted(client.limiter_waits)
+            result = {
+                "route": route,
+                "round": round_number,
+                "images": len(image_files),
+                "seconds": round(seconds, 3),
+                "images_per_second": round(len(image_files) / seconds, 3),
+                "requests": len(latencies),
+                "latency_p50": percentile(latencies, 50),
+                "latency_p95": percentile(latencies, 95),
+                "limiter_wait_p50": percentile(waits, 50),
+                "limiter_wait_p95": percentile(waits, 95),
+                "retries": client.retries - retries_before
+            }
+            results.append(result)
+            print(f"{route:8s} round {round_number}: {result['images_per_second']:6.2f} images/s, "
+                  f"{result['requests']} requests, p50 {result['latency_p50']}s, "
+                  f"p95 {result['latency_p95']}s, {result['retries']} retries"
+                  + (f", limiter wait p95 {result['limiter_wait_p95']}s" if args.rate_limit else ""))
+
+    print("\n=== SUMMARY ===")
+    for route in dict.fromkeys(r["route"] for r in results):
+        rows = [r for r in results if r["route"] == route]
+        print(f"{route:8s} {sum(r['images'] for r in rows) / sum(r['seconds'] for r in rows):6.2f} images/s, "
+              f"median p50 {sorted(r['latency_p50'] or 0 for r in rows)[len(rows) // 2]}s, "
+              f"max p95 {max(r['latency_p95'] or 0 for r in rows)}s, "
+              f"{sum(r['retries'] for r in rows)} retries")
+    print(f"Model tiers: {ocr_tier_stats.stats()}")
+    if server is not None:
+        print(f"Mock server: {server.stats()}")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"rounds": results, "server": server.stats() if server else None}, f, indent=2)
+    print(f"\nResults saved as: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Local stand-in for the OpenRouter chat completions endpoint, to measure and
+regression-test the OCR path without calling the paid, rate-limited API.
+
+Every request waits a configurable latency and answers with canned
+structured "records" JSON derived from the image it was sent, so the same
+image always gets the same records. A share of the requests can fail with
+500, a share of the records can come back with an invalid date and, every
+--burst-every seconds, all requests are rate limited with 429 and a
+Retry-After header for --burst-length seconds.
+
+    python mock_openrouter.py --port 8765 --latency 1.5 --error-rate 0.05
+    OPENROUTER_URL=http://127.0.0.1:8765/api/v1/chat/completions python extract.py --use-ocr
+
+GET /stats returns the counters of the answered requests.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_COMPLETIONS_PATH = "/api/v1/chat/completions"
+
+
+def canned_records(image_url, rows=None, invalid_rate=0.0):
+    """
+    Deterministic vacation/contract records for an image, top to bottom;
+    about invalid_rate of them get an impossible fechaAlta.
+    """
+    seed = int(hashlib.sha256(image_url.encode("utf-8")).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    rows = rows if rows is not None else rng.randint(3, 10)
+    records = []
+    for i in range(rows):
+        year, month, day = rng.randint(2004, 2024), rng.randint(1, 12), rng.randint(1, 20)
+        length = rng.randint(0, 8)
+        invalid = rng.random() < invalid_rate
+        records.append({
+            "isVacaciones": rng.random() < 0.7,
+            "fechaAlta": f"31/02/{year}" if invalid else f"{day:02d}/{month:02d}/{year}",
+            "fechaBaja": f"{day + length:02d}/{month:02d}/{year}",
+            "rowPosition": round((i + 0.5) / rows, 3)
+        })
+    return records
+
+
+class MockOpenRouter(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=1.0, jitter=0.5, error_rate=0.0, invalid_rate=0.0,
+                 burst_every=0.0, burst_length=0.0, seed=None):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.invalid_rate = invalid_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.started = time.monotonic()
+        self.random = random.Random(seed)
+        self.counters = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "bytes_received": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{CHAT_COMPLETIONS_PATH}"
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def rate_limit_remaining(self):
+        """Seconds left of the current 429 burst, or 0 outside bursts."""
+        if self.burst_every <= 0 or self.burst_length <= 0:
+            return 0.0
+        phase = (time.monotonic() - self.started) % self.burst_every
+        return max(0.0, self.burst_length - phase)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != CHAT_COMPLETIONS_PATH:
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        server.count("requests")
+        server.count("bytes_received", len(body))
+
+        remaining = server.rate_limit_remaining()
+        if remaining:
+            server.count("rate_limited")
+            self._send_json(429, {"error": {"code": 429, "message": "Rate limit exceeded"}},
+                            {"Retry-After": str(math.ceil(remaining))})
+            return
+
+        with server._lock:
+            delay = max(0.0, server.latency + server.random.uniform(-server.jitter, server.jitter))
+            failed = server.random.random() < server.error_rate
+        time.sleep(delay)
+        if failed:
+            server.count("errors")
+            self._send_json(500, {"error": {"code": 500, "message": "Internal error"}})
+            return
+
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        try:
+            payload = json.loads(body)
+            content = payload["messages"][0]["content"]
+            prompt = next(part["text"] for part in content if part["type"] == "text")
+            image_url = next(part["image_url"]["url"] for part in content if part["type"] == "image_url")
+        except (ValueError, KeyError, IndexError, StopIteration):
+            self._send_json(400, {"error": {"code": 400, "message": "Invalid request"}})
+            return
+
+        # Crops of a single row (see ocr_processor.ROW_PROMPT) get one valid record
+        if "horizontal strip" in prompt:
+            records = canned_records(image_url, rows=1)
+        else:
+            records = canned_records(image_url, invalid_rate=server.invalid_rate)
+        server.count("ok")
+        self._send_json(200, {
+            "id": f"mock-{server.stats()['requests']}",
+            "model": payload.get("model"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": json.dumps({"records": records})}
+            }]
+        })
+
+
+def start_mock_server(host="127.0.0.1", port=0, **settings):
+    """Start a MockOpenRouter in a background thread and return it (see its url)."""
+    server = MockOpenRouter((host, port), **settings)
+    threading.Thread(target=server.serve_forever, name="mock-openrouter", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenRouter chat completions API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=1.0, help='Mean seconds per request')
+    parser.add_argument('--jitter', type=float, default=0.5, help='Latency varies uniformly by up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 500')
+    parser.add_argument('--invalid-rate', type=float, default=0.0,
+                        help='Share of records returned with an invalid date')
+    parser.add_argument('--burst-every', type=float, default=0.0, help='Seconds between 429 bursts (0: none)')
+    parser.add_argument('--burst-length', type=float, default=0.0, help='Seconds each 429 burst lasts')
+    args = parser.parse_args()
+
+    server = MockOpenRouter((args.host, args.port), latency=args.latency, jitter=args.jitter,
+                            error_rate=args.error_rate, invalid_rate=args.invalid_rate,
+                            burst_every=args.burst_every,
+                            burst_length=args.burst_length)
+    print(f"Mock OpenRouter listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Requests: {server.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Disk cache of OCR results.
+
+Entries are keyed by the SHA-256 of the image exactly as it is sent to the
+API (the preprocessed data URL) together with the model and the prompt
+version, so re-running the OCR over the same photos costs no API calls and
+any change to the preprocessing, model or prompt misses the cache. Entries
+expire after a TTL and the cache is bounded in size, evicting the least
+recently used entries first.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+
+
+def ocr_cache_key(image_url, model, prompt_version):
+    """SHA-256 of the image sent to the API plus the model and prompt version."""
+    digest = hashlib.sha256(image_url.encode("utf-8"))
+    digest.update(f"\0{model}\0{prompt_version}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class OCRCache:
+    """
+    Size-bounded LRU cache of OCR records stored as one JSON file per key.
+    Each entry keeps its creation time for the TTL; recency is tracked with
+    the file modification time, which is refreshed on every hit.
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """Cached records for a key, or None if missing or expired."""
+        return self.get_first([key])[1]
+
+    def get_first(self, keys):
+        """
+        (key, records) of the first of keys with a live entry, or
+        (None, None). The lookup counts as a single hit or miss.
+        """
+        for key in keys:
+            records = self._read(key)
+            if records is not None:
+                with self._lock:
+                    self.hits += 1
+                return key, records
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            if time.time() - entry["created"] > self.ttl:
+                os.remove(path)
+                return None
+            os.utime(path)
+            return entry["records"]
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+    def put(self, key, records):
+        entry = {"created": time.time(), "records": records}
+        # Write to a temporary file first so readers never see half an entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, self._path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            # The creation time is never later than the last access, so
+            # entries not touched within the TTL are expired too
+            if now - stat.st_mtime > self.ttl:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
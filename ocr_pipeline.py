@@ -0,0 +1,238 @@
+"""
+Staged OCR pipeline for a batch of images.
+
+    preprocess (process pool) -> OCR requests (thread pool) -> normalize
+
+Preprocessing is CPU-bound PIL/OpenCV work, so it runs in worker processes
+of a shared forkserver pool (see process_pool.py), or inline with
+preprocess_workers=1, while the OCR stage waits on the network in threads;
+the normalize stage merges the row bands of each image and converts the
+records with convert_ocr_to_extract_format. Bounded queues between the stages apply
+backpressure: preprocessing stops getting ahead of the OCR once the queue
+is full, so CPU and network work overlap without holding every encoded
+image in memory. Busy time and throughput are measured per stage.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Tuple
+
+from ocr_processor import (OCR_CONCURRENCY, convert_ocr_to_extract_format, encode_image_urls,
+                           get_ocr_client, merge_band_records, process_image_with_ocr)
+from process_pool import get_process_pool
+
+logger = logging.getLogger(__name__)
+
+# Processes preprocessing images: inline by default, since web requests
+# already run side by side; 0 for one per CPU
+OCR_PREPROCESS_WORKERS = int(os.getenv('OCR_PREPROCESS_WORKERS', 1))
+# Seconds an image may take to preprocess in a worker process before it is
+# given up as failed
+OCR_PREPROCESS_TIMEOUT = float(os.getenv('OCR_PREPROCESS_TIMEOUT', 120))
+# Items waiting between two stages
+OCR_QUEUE_SIZE = int(os.getenv('OCR_QUEUE_SIZE', 2 * OCR_CONCURRENCY))
+
+_DONE = object()
+
+
+class StageStats:
+    """Items processed by a pipeline stage and the time its workers were busy."""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.first_start = None
+        self.last_end = None
+        self._lock = threading.Lock()
+
+    def record(self, started, items=1):
+        ended = time.perf_counter()
+        with self._lock:
+            self.items += items
+            self.busy += ended - started
+            self.first_start = started if self.first_start is None else min(self.first_start, started)
+            self.last_end = ended if self.last_end is None else max(self.last_end, ended)
+
+    def report(self) -> Dict:
+        seconds = (self.last_end - self.first_start) if self.items else 0.0
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "busy_seconds": round(self.busy, 3),
+            "seconds": round(seconds, 3),
+            "items_per_second": round(self.items / seconds, 2) if seconds else None,
+            # Mean fraction of the stage's workers that were busy while it ran
+            "utilization": round(self.busy / (seconds * self.workers), 2) if seconds else None
+        }
+
+
+def _encode_timed(image_path):
+    started = time.perf_counter()
+    return encode_image_urls(image_path), time.perf_counter() - started
+
+
+def run_ocr_pipeline(image_paths: List[str], preprocess_workers: int = None, ocr_workers: int = None,
+                     queue_size: int = OCR_QUEUE_SIZE,
+                     on_result: Callable[[int, List[Dict], list], None] = None) -> Tuple[List[Tuple[List[Dict], list]], Dict]:
+    """
+    OCR a batch of images through the three stages.
+    Returns (results, stats): for each image, in the order of image_paths,
+    the OCR records and their convert_ocr_to_extract_format Records (both
+    empty for images that fail), and the report of each stage.
+    on_result(index, ocr_records, records) is called from the calling
+    thread as soon as each image is complete, in completion order. If it
+    raises, the remaining images are dropped and the exception propagates
+    once the stages have stopped.
+    """
+    results = [([], []) for _ in image_paths]
+    if not image_paths:
+        return results, {}
+
+    if preprocess_workers is None:
+        preprocess_workers = OCR_PREPROCESS_WORKERS
+    preprocess_workers = preprocess_workers or os.cpu_count() or 1
+    pool_workers = preprocess_workers
+    preprocess_workers = min(preprocess_workers, len(image_paths))
+    ocr_workers = ocr_workers or OCR_CONCURRENCY
+
+    stats = {
+        "preprocess": StageStats("preprocess", preprocess_workers),
+        "ocr": StageStats("ocr", ocr_workers),
+        "normalize": StageStats("normalize", 1),
+    }
+    # (image index, band index, band count, data URL) and
+    # (image index, band index, band count, records)
+    ocr_queue = queue.Queue(maxsize=queue_size)
+    normalize_queue = queue.Queue(maxsize=queue_size)
+    client = get_ocr_client()
+    # Band bounds of each image, for merge_band_records
+    image_bounds = {}
+    # Set when the normalize stage fails, so the other stages skip their work
+    stopped = threading.Event()
+
+    def put_bands(index, urls, bounds=None):
+        image_bounds[index] = bounds
+        if not urls:
+            # Nothing to OCR, the normalize stage still completes the image
+            normalize_queue.put((index, 0, 1, []))
+        for band, url in enumerate(urls):
+            ocr_queue.put((index, band, len(urls), url))
+
+    def collect(index, path, future):
+        try:
+            (urls, bounds), seconds = future.result(timeout=OCR_PREPROCESS_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Error preprocessing {path}: {e}", exc_info=True)
+            (urls, bounds), seconds = ([], None), 0.0
+        # Busy time is measured in the worker process
+        stats["preprocess"].record(time.perf_counter() - seconds)
+        put_bands(index, urls, bounds)
+
+    def preprocess_stage():
+        try:
+            if preprocess_workers <= 1:
+                for index, path in enumerate(image_paths):
+                    if stopped.is_set():
+                        return
+                    started = time.perf_counter()
+                    try:
+                        urls, bounds = encode_image_urls(path)
+                    except Exception as e:
+                        logger.error(f"Error preprocessing {path}: {e}", exc_info=True)
+                        urls, bounds = [], None
+                    stats["preprocess"].record(started)
+                    put_bands(index, urls, bounds)
+                return
+
+            # Keep a bounded window of submitted images; waiting on the
+            # oldest one keeps the output in image order
+            pool = get_process_pool(pool_workers)
+            pending = deque()
+            for index, path in enumerate(image_paths):
+                if stopped.is_set():
+                    break
+                pending.append((index, path, pool.submit(_encode_timed, path)))
+                if len(pending) >= 2 * preprocess_workers:
+                    collect(*pending.popleft())
+            while pending and not stopped.is_set():
+                collect(*pending.popleft())
+            for _, _, future in pending:
+                future.cancel()
+        finally:
+            for _ in range(ocr_workers):
+                ocr_queue.put(_DONE)
+
+    def ocr_stage():
+        while True:
+            item = ocr_queue.get()
+            if item is _DONE:
+                return
+            if stopped.is_set():
+                continue
+            index, band, bands, url = item
+            started = time.perf_counter()
+            label = image_paths[index] if bands == 1 else f"{image_paths[index]} (band {band + 1}/{bands})"
+            try:
+                records = process_image_with_ocr(label, client, image_url=url, band=bands > 1)
+            except Exception as e:
+                logger.error(f"Error processing {label}: {e}", exc_info=True)
+                records = []
+            stats["ocr"].record(started)
+            normalize_queue.put((index, band, bands, records))
+
+    producer = threading.Thread(target=preprocess_stage, name="ocr-preprocess", daemon=True)
+    consumers = [threading.Thread(target=ocr_stage, name=f"ocr-request-{i}", daemon=True)
+                 for i in range(ocr_workers)]
+    producer.start()
+    for thread in consumers:
+        thread.start()
+
+    def close_normalize_queue():
+        for thread in consumers:
+            thread.join()
+        normalize_queue.put(_DONE)
+
+    threading.Thread(target=close_normalize_queue, name="ocr-close", daemon=True).start()
+
+    # Normalize stage, in the calling thread: merge the bands of each image
+    # once all of them are back
+    band_records = {}
+    try:
+        while True:
+            item = normalize_queue.get()
+            if item is _DONE:
+                break
+            index, band, bands, records = item
+            started = time.perf_counter()
+            image_bands = band_records.setdefault(index, [None] * bands)
+            image_bands[band] = records
+            if all(part is not None for part in image_bands):
+                del band_records[index]
+                bounds = image_bounds.pop(index)
+                try:
+                    ocr_records = merge_band_records(image_bands, bounds) if bands > 1 else image_bands[0]
+                    results[index] = (ocr_records, convert_ocr_to_extract_format(ocr_records))
+                except Exception as e:
+                    logger.error(f"Error normalizing {image_paths[index]}: {e}", exc_info=True)
+                    results[index] = ([], [])
+                stats["normalize"].record(started)
+                if on_result is not None:
+                    on_result(index, *results[index])
+    except BaseException:
+        # Keep taking items until every stage has finished, so none of them
+        # stays blocked on a full queue
+        stopped.set()
+        while normalize_queue.get() is not _DONE:
+            pass
+        raise
+    finally:
+        producer.join()
+
+    report = {name: stage.report() for name, stage in stats.items()}
+    logger.info(f"OCR pipeline throughput: {report}")
+    return results, report
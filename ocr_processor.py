@@ -1,17 +1,84 @@
 import os
 import base64
+import gzip
+import io
 import json
+import random
+import tempfile
+import threading
+import time
 import requests
-from typing import List, Dict
+from requests.adapters import HTTPAdapter
+from PIL import Image
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
 import datetime
 import logging
+from records import Record, parse_date
+from ocr_cache import OCRCache, ocr_cache_key
+from image_dedup import find_near_duplicates
+from rate_limiter import SharedRateLimiter
+from image_preprocessing import (BAND_OVERLAP_ROWS, BAND_ROWS, TARGET_TEXT_HEIGHT, preprocess_bands,
+                                 preprocess_image)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY', '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')
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_URL = os.getenv('OPENROUTER_URL', "https://openrouter.ai/api/v1/chat/completions")
+OCR_MODEL = "mistralai/pixtral-large-2411"  # Mistral's vision model with OCR capabilities
+# Smaller, faster vision model tried first; images whose records fail
+# validation are sent again to OCR_MODEL. Empty to always use OCR_MODEL
+OCR_FAST_MODEL = os.getenv('OCR_FAST_MODEL', 'mistralai/pixtral-12b')
+# More records than this from one image (or band) is not a plausible table
+OCR_MAX_RECORDS = int(os.getenv('OCR_MAX_RECORDS', 40))
+# Invalid records are re-read from a crop around their row, up to this many
+# per image; images with more invalid rows go straight to the next tier
+OCR_MAX_ROW_REPAIRS = int(os.getenv('OCR_MAX_ROW_REPAIRS', 5))
+# Bump when the prompt or the response schema changes so cached results are not reused
+OCR_PROMPT_VERSION = "2"
+
+# Images sent to OpenRouter at the same time
+OCR_CONCURRENCY = int(os.getenv('OCR_CONCURRENCY', 4))
+# Rate limited (429) and server error responses are retried with exponential
+# backoff and jitter: up to OCR_MAX_RETRIES times, waiting at most OCR_BACKOFF_MAX seconds
+OCR_MAX_RETRIES = int(os.getenv('OCR_MAX_RETRIES', 4))
+OCR_BACKOFF_BASE = float(os.getenv('OCR_BACKOFF_BASE', 1.0))
+OCR_BACKOFF_MAX = float(os.getenv('OCR_BACKOFF_MAX', 30.0))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# "adaptive" measures each image and picks the resolution, colour and
+# quality it needs (see image_preprocessing.py); "legacy" always upscales
+# to 2000px and saves a quality-98 JPEG
+OCR_PREPROCESSING = os.getenv('OCR_PREPROCESSING', 'adaptive')
+# Deskew and crop the adaptive images to the table before encoding them
+OCR_CROP_TABLE = os.getenv('OCR_CROP_TABLE', '1').lower() in ('1', 'true', 'yes')
+# Split tall tables into overlapping row bands that are OCR'd concurrently
+OCR_TILE_BANDS = os.getenv('OCR_TILE_BANDS', '1').lower() in ('1', 'true', 'yes')
+# Skip images that are near-duplicates of an earlier image of the same batch
+OCR_DEDUP = os.getenv('OCR_DEDUP', '1').lower() in ('1', 'true', 'yes')
+
+# Keep-alive connection pool shared by every OCR request of the process
+OCR_POOL_SIZE = int(os.getenv('OCR_POOL_SIZE', OCR_CONCURRENCY))
+OCR_CONNECT_TIMEOUT = float(os.getenv('OCR_CONNECT_TIMEOUT', 10))
+OCR_READ_TIMEOUT = float(os.getenv('OCR_READ_TIMEOUT', 60))
+# Send the JSON body gzip-compressed (Content-Encoding: gzip)
+OCR_COMPRESS_PAYLOAD = os.getenv('OCR_COMPRESS_PAYLOAD', '').lower() in ('1', 'true', 'yes')
+
+# Requests per second (0 disables the limit), burst and requests in flight
+# allowed across every process of the host (see rate_limiter.py)
+OCR_RATE_LIMIT = float(os.getenv('OCR_RATE_LIMIT', 5))
+OCR_RATE_BURST = float(os.getenv('OCR_RATE_BURST', OCR_RATE_LIMIT))
+OCR_MAX_IN_FLIGHT = int(os.getenv('OCR_MAX_IN_FLIGHT', 8))
+OCR_RATE_LIMIT_DB = os.getenv('OCR_RATE_LIMIT_DB', os.path.join(tempfile.gettempdir(), 'ocr_rate_limit.sqlite3'))
+
+# Disk cache of OCR results (empty OCR_CACHE_DIR disables it); entries
+# expire after OCR_CACHE_TTL seconds
+OCR_CACHE_DIR = os.getenv('OCR_CACHE_DIR', os.path.join('cache', 'ocr'))
+OCR_CACHE_TTL = float(os.getenv('OCR_CACHE_TTL', 30 * 24 * 3600))
+OCR_CACHE_MAX_BYTES = int(os.getenv('OCR_CACHE_MAX_BYTES', 20 * 1024 * 1024))
 
 def encode_image_to_base64(image_path: str) -> str:
     """Convert image to base64 string for API with quality optimization."""
@@ -54,14 +121,476 @@ def encode_image_to_base64(image_path: str) -> str:
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
 
-def process_image_with_ocr(image_path: str) -> List[Dict]:
+def encode_image_for_ocr(image_path: str, preprocessing: str = None,
+                         target_text_height: float = TARGET_TEXT_HEIGHT) -> str:
+    """Data URL of the image as sent to the OCR API, logging its payload size and encoding time."""
+    preprocessing = preprocessing or OCR_PREPROCESSING
+    if preprocessing == "legacy":
+        started = time.perf_counter()
+        base64_image = encode_image_to_base64(image_path)
+        logger.info(f"Preprocessed {image_path} (legacy): {len(base64_image)} payload bytes "
+                    f"in {time.perf_counter() - started:.3f}s")
+        return f"data:image/jpeg;base64,{base64_image}"
+
+    image = preprocess_image(image_path, target_text_height, crop_table=OCR_CROP_TABLE)
+    logger.info(f"Preprocessed {image_path}: {image.report()}")
+    return f"data:{image.mime_type};base64,{base64.b64encode(image.data).decode('utf-8')}"
+
+def encode_bands_for_ocr(image_path: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """
+    Data URLs of the overlapping row bands of an image, top to bottom, and
+    the (top, bottom) pixel rows of each band.
+    """
+    bands = preprocess_bands(image_path, crop_table=OCR_CROP_TABLE)
+    urls = []
+    for i, band in enumerate(bands, 1):
+        logger.info(f"Preprocessed {image_path} band {i}/{len(bands)}: {band.report()}")
+        urls.append(f"data:{band.mime_type};base64,{base64.b64encode(band.data).decode('utf-8')}")
+    return urls, [band.settings["band"] for band in bands]
+
+def encode_image_urls(image_path: str, tile: bool = None) -> Tuple[List[str], Optional[List[Tuple[int, int]]]]:
+    """
+    Data URLs to OCR for an image: its row bands when tiling (OCR_TILE_BANDS
+    by default), otherwise the whole image. Returns (urls, bounds), where
+    bounds are the band bounds for merge_band_records, or None.
+    """
+    if tile is None:
+        tile = OCR_TILE_BANDS
+    if tile and OCR_PREPROCESSING != "legacy":
+        return encode_bands_for_ocr(image_path)
+    return [encode_image_for_ocr(image_path)], None
+
+def _has_position(record: Dict) -> bool:
+    return isinstance(record.get('rowPosition'), (int, float)) and not isinstance(record['rowPosition'], bool)
+
+def merge_band_records(band_records: List[List[Dict]], bounds: List[Tuple[int, int]] = None,
+                       max_overlap: int = int(BAND_OVERLAP_ROWS) + 2) -> List[Dict]:
+    """
+    Concatenate the records of consecutive bands, dropping the rows read
+    twice in the overlap.
+
+    With the (top, bottom) bounds of each band, records are placed on the
+    whole image by their rowPosition: a record of the overlap within half a
+    row of one of the previous band is the same table row, even when the
+    two bands read it differently, and the read farther from its band's
+    edge is kept. rowPosition then becomes relative to the whole image.
+    Without bounds or positions, the longest run (up to max_overlap records)
+    at the start of a band that exactly repeats the end of the previous
+    bands is dropped.
+    """
+    if bounds is not None and all(_has_position(r) for records in band_records for r in records):
+        return _merge_band_records_by_position(band_records, bounds)
+
+    def key(record):
+        return (record.get('isVacaciones'), record.get('fechaAlta'), record.get('fechaBaja'))
+
+    merged = []
+    for records in band_records:
+        keys = [key(r) for r in records]
+        merged_keys = [key(r) for r in merged[-max_overlap:]]
+        shared = 0
+        for k in range(min(len(merged_keys), len(keys), max_overlap), 0, -1):
+            if merged_keys[-k:] == keys[:k]:
+                shared = k
+                break
+        merged.extend(records[shared:])
+    return merged
+
+def _merge_band_records_by_position(band_records: List[List[Dict]], bounds: List[Tuple[int, int]]) -> List[Dict]:
+    # Pixel row of each record on the whole image
+    placed = []
+    for records, (top, bottom) in zip(band_records, bounds):
+        placed.append([(top + min(max(r['rowPosition'], 0.0), 1.0) * (bottom - top), r) for r in records])
+
+    # Table rows are evenly spaced: the row height is the median gap
+    # between the records of a band
+    gaps = sorted(b - a for band in placed for (a, _), (b, _) in zip(band, band[1:]) if b > a)
+    if gaps:
+        row_height = gaps[len(gaps) // 2]
+    else:
+        row_height = max(bottom - top for top, bottom in bounds) / BAND_ROWS
+
+    # (y, record, band index) of the records kept so far
+    merged = [(y, record, 0) for y, record in placed[0]]
+    for i in range(1, len(placed)):
+        top, previous_bottom = bounds[i][0], bounds[i - 1][1]
+        matched = set()
+        for y, record in placed[i]:
+            match = None
+            if y <= previous_bottom + row_height / 2:
+                candidates = [(abs(y - other_y), j) for j, (other_y, _, band) in enumerate(merged)
+                              if band == i - 1 and j not in matched and abs(y - other_y) <= row_height / 2]
+                match = min(candidates)[1] if candidates else None
+            if match is None:
+                merged.append((y, record, i))
+                continue
+            matched.add(match)
+            other_y = merged[match][0]
+            if y - top > previous_bottom - other_y:
+                merged[match] = (y, record, i)
+
+    height = bounds[-1][1] or 1
+    return [{**record, 'rowPosition': round(y / height, 3)} for y, record, _ in merged]
+
+def _process_image_in_bands(image_path: str, client: "OCRClient") -> List[Dict]:
+    urls, bounds = encode_image_urls(image_path, tile=True)
+    if len(urls) == 1:
+        return process_image_with_ocr(image_path, client, image_url=urls[0])
+
+    def process_band(item):
+        i, url = item
+        return process_image_with_ocr(f"{image_path} (band {i}/{len(urls)})", client, image_url=url, band=True)
+
+    with ThreadPoolExecutor(max_workers=min(OCR_CONCURRENCY, len(urls))) as pool:
+        band_records = list(pool.map(process_band, enumerate(urls, 1)))
+    records = merge_band_records(band_records, bounds)
+    logger.info(f"Merged {sum(map(len, band_records))} band records of {image_path} into {len(records)}")
+    return records
+
+def backoff_delay(attempt: int, retry_after: str = None) -> float:
+    """Seconds to wait before retry number attempt (0-based), with full jitter."""
+    if retry_after:
+        try:
+            return min(float(retry_after), OCR_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(OCR_BACKOFF_MAX, OCR_BACKOFF_BASE * 2 ** attempt))
+
+def percentile(sorted_values: List[float], p: float):
+    """Nearest-rank percentile of sorted values, rounded to milliseconds; None when empty."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return round(sorted_values[int(rank) - 1], 3)
+
+class OCRClient:
+    """
+    HTTP client for the OCR API holding a pooled keep-alive session, so
+    consecutive and concurrent requests reuse TCP/TLS connections instead of
+    opening a new one per image. One client is meant to be shared by the
+    whole process (see get_ocr_client).
+    """
+
+    def __init__(self, url: str = OPENROUTER_URL, api_key: str = OPENROUTER_API_KEY,
+                 pool_size: int = OCR_POOL_SIZE, connect_timeout: float = OCR_CONNECT_TIMEOUT,
+                 read_timeout: float = OCR_READ_TIMEOUT, compress: bool = OCR_COMPRESS_PAYLOAD,
+                 limiter: SharedRateLimiter = None):
+        self.url = url
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.compress = compress
+        self.retries = 0
+        # Seconds taken by the most recent post() calls, retries included,
+        # and the part of them spent waiting for the rate limiter, which is
+        # left out of the latencies
+        self.latencies = deque(maxlen=1000)
+        self.limiter_waits = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        if limiter is None and OCR_RATE_LIMIT > 0:
+            limiter = SharedRateLimiter(OCR_RATE_LIMIT_DB, OCR_RATE_LIMIT, OCR_RATE_BURST, OCR_MAX_IN_FLIGHT)
+        self.limiter = limiter
+
+        # pool_block makes threads wait for a free connection instead of
+        # opening (and then dropping) connections beyond the pool size
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+
+    def post(self, payload: Dict) -> requests.Response:
+        """
+        POST a JSON payload, retrying 429/5xx responses and connection errors
+        with exponential backoff. The last response is returned (or the last
+        error raised) once the retries are exhausted. Every attempt waits
+        its turn in the shared rate limiter.
+        """
+        body = json.dumps(payload).encode('utf-8')
+        headers = {}
+        if self.compress:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+
+        started = time.perf_counter()
+        waited = 0.0
+
+        def record():
+            self.latencies.append(time.perf_counter() - started - waited)
+            self.limiter_waits.append(waited)
+
+        for attempt in range(OCR_MAX_RETRIES + 1):
+            try:
+                wait_started = time.perf_counter()
+                lease = self.limiter.acquire() if self.limiter else None
+                waited += time.perf_counter() - wait_started
+                try:
+                    response = self.session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+                finally:
+                    if lease is not None:
+                        self.limiter.release(lease)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == OCR_MAX_RETRIES:
+                    record()
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"Request failed ({e}), retrying in {delay:.1f}s")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == OCR_MAX_RETRIES:
+                    record()
+                    return response
+                delay = backoff_delay(attempt, response.headers.get('Retry-After'))
+                logger.warning(f"Response status {response.status_code}, retrying in {delay:.1f}s")
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+
+    def stats(self) -> Dict:
+        """Request and connection counters of the pool, for monitoring."""
+        requests_sent = connections = 0
+        for key in list(self._adapter.poolmanager.pools.keys()):
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is not None:
+                requests_sent += pool.num_requests
+                connections += pool.num_connections
+        latencies = sorted(self.latencies)
+        waits = sorted(self.limiter_waits)
+        return {
+            "requests": requests_sent,
+            "connections_opened": connections,
+            "connections_reused": requests_sent - connections,
+            "retries": self.retries,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "limiter_wait_p50": percentile(waits, 50),
+            "limiter_wait_p95": percentile(waits, 95),
+            "pool_size": self.pool_size,
+            "compress": self.compress,
+            "rate_limiter": self.limiter.stats() if self.limiter else None
+        }
+
+    def close(self):
+        self.session.close()
+
+class TierStats:
+    """Requests, latency and validation failures of each OCR model tier."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers = {}
+        self.routed = 0
+        self.escalated = 0
+        self.row_repairs = 0
+        self.rows_repaired = 0
+
+    def record(self, tier: int, model: str, seconds: float, failed: bool, last_tier: bool):
+        with self._lock:
+            stats = self._tiers.setdefault(tier, {"model": model, "requests": 0, "failed_validation": 0,
+                                                  "seconds": 0.0, "max_seconds": 0.0})
+            stats["requests"] += 1
+            stats["failed_validation"] += failed
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            if tier == 0:
+                self.routed += 1
+            if failed and not last_tier:
+                self.escalated += 1
+
+    def record_repairs(self, attempted: int, fixed: int):
+        with self._lock:
+            self.row_repairs += attempted
+            self.rows_repaired += fixed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            tiers = [{
+                "model": stats["model"],
+                "requests": stats["requests"],
+                "failed_validation": stats["failed_validation"],
+                "mean_seconds": round(stats["seconds"] / stats["requests"], 3),
+                "max_seconds": round(stats["max_seconds"], 3)
+            } for _, stats in sorted(self._tiers.items())]
+            return {
+                "tiers": tiers,
+                "routed": self.routed,
+                "escalated": self.escalated,
+                "escalation_rate": round(self.escalated / self.routed, 3) if self.routed else None,
+                "row_repairs": self.row_repairs,
+                "rows_repaired": self.rows_repaired
+            }
+
+ocr_tier_stats = TierStats()
+
+def ocr_models() -> List[str]:
+    """The models tried for each image, fastest first."""
+    if OCR_FAST_MODEL and OCR_FAST_MODEL != OCR_MODEL:
+        return [OCR_FAST_MODEL, OCR_MODEL]
+    return [OCR_MODEL]
+
+def validate_ocr_records(records: List[Dict], max_records: int = OCR_MAX_RECORDS,
+                         allow_empty: bool = False) -> List[str]:
+    """
+    Problems that make the OCR output of an image untrustworthy: no
+    records or more than max_records, dates that are not valid DD/MM/YYYY
+    and fechaBaja before fechaAlta. An empty list means the output is valid.
+    With allow_empty, no records is valid: a row band of a page often has
+    no vacation or SESPA rows at all.
+    """
+    if not records:
+        return [] if allow_empty else ["no records"]
+    problems = []
+    if len(records) > max_records:
+        problems.append(f"{len(records)} records")
+    for i, record in enumerate(records, 1):
+        problems.extend(f"record {i}: {problem}" for problem in record_problems(record))
+    return problems
+
+def record_problems(record: Dict) -> List[str]:
+    """Invalid dates of one OCR record (see validate_ocr_records)."""
+    problems = []
+    alta = parse_date(format_date_for_output(record.get('fechaAlta', '')))
+    baja_str = record.get('fechaBaja', '')
+    baja = parse_date(format_date_for_output(baja_str))
+    if alta is None:
+        problems.append(f"invalid fechaAlta '{record.get('fechaAlta', '')}'")
+    if baja_str and baja is None:
+        problems.append(f"invalid fechaBaja '{baja_str}'")
+    if alta is not None and baja is not None and baja < alta:
+        problems.append("fechaBaja before fechaAlta")
+    return problems
+
+def crop_row(image_url: str, position: float, row_height: float) -> str:
+    """
+    Data URL of a strip of the image centred on a row. position and
+    row_height are fractions of the image height.
+    """
+    image = Image.open(io.BytesIO(base64.b64decode(image_url.split(",", 1)[1])))
+    half = max(1.2 * row_height, 24 / image.height)
+    top = max(0, int((position - half) * image.height))
+    bottom = min(image.height, int((position + half) * image.height))
+    strip = image.crop((0, top, image.width, max(bottom, top + 1)))
+    buffer = io.BytesIO()
+    strip.convert("RGB" if strip.mode not in ("L", "RGB") else strip.mode).save(buffer, format="JPEG", quality=90)
+    return f"data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
+
+def repair_invalid_rows(image_path: str, client: OCRClient, image_url: str, records: List[Dict]) -> List[Dict]:
+    """
+    Re-read the invalid records from a crop around their rowPosition with a
+    focused prompt and OCR_MODEL, patching in the corrected ones. Returns
+    the records unchanged when there are none or more than
+    OCR_MAX_ROW_REPAIRS to repair.
+    """
+    invalid = [(i, problems) for i, problems in ((i, record_problems(r)) for i, r in enumerate(records))
+               if problems and isinstance(records[i].get('rowPosition'), (int, float))]
+    if not invalid or len(invalid) > OCR_MAX_ROW_REPAIRS:
+        return records
+
+    # Rows are about as tall as the spacing between consecutive records
+    positions = sorted(r['rowPosition'] for r in records if isinstance(r.get('rowPosition'), (int, float)))
+    gaps = [b - a for a, b in zip(positions, positions[1:]) if b - a > 0.005]
+    row_height = sorted(gaps)[len(gaps) // 2] if gaps else 0.04
+
+    def repair(item):
+        i, problems = item
+        record = records[i]
+        previous = {k: record.get(k) for k in ('isVacaciones', 'fechaAlta', 'fechaBaja')}
+        prompt = ROW_PROMPT.format(previous=json.dumps(previous, ensure_ascii=False), problems="; ".join(problems))
+        url = crop_row(image_url, min(max(record['rowPosition'], 0.0), 1.0), row_height)
+        candidates = _request_ocr(f"{image_path} (row {i + 1})", client, url, OCR_MODEL, prompt) or []
+        valid = [c for c in candidates if not record_problems(c)]
+        if not valid:
+            return None
+        best = min(valid, key=lambda c: abs(c.get('rowPosition', 0.5) - 0.5))
+        return {**best, 'rowPosition': record['rowPosition']}
+
+    with ThreadPoolExecutor(max_workers=min(OCR_CONCURRENCY, len(invalid))) as pool:
+        repaired = list(pool.map(repair, invalid))
+
+    records = list(records)
+    for (i, _), record in zip(invalid, repaired):
+        if record is not None:
+            records[i] = record
+    fixed = sum(record is not None for record in repaired)
+    ocr_tier_stats.record_repairs(len(invalid), fixed)
+    logger.info(f"Re-read {len(invalid)} invalid rows of {image_path} from crops, {fixed} fixed")
+    return records
+
+_ocr_client = None
+_ocr_client_lock = threading.Lock()
+
+def get_ocr_client() -> OCRClient:
+    """The OCR client shared by the CLI batch run and the Flask request threads."""
+    global _ocr_client
+    with _ocr_client_lock:
+        if _ocr_client is None:
+            _ocr_client = OCRClient()
+        return _ocr_client
+
+_ocr_cache = None
+
+def get_ocr_cache() -> OCRCache:
+    """The shared OCR result cache, or None when OCR_CACHE_DIR is empty."""
+    global _ocr_cache
+    if not OCR_CACHE_DIR:
+        return None
+    with _ocr_client_lock:
+        if _ocr_cache is None:
+            _ocr_cache = OCRCache(OCR_CACHE_DIR, ttl=OCR_CACHE_TTL, max_bytes=OCR_CACHE_MAX_BYTES)
+        return _ocr_cache
+
+def process_image_with_ocr(image_path: str, client: OCRClient = None, image_url: str = None,
+                           tile: bool = None, band: bool = False) -> List[Dict]:
     """
     Process a single image using OpenRouter API to extract vacation/contract data.
     Returns a list of records in the same format as the PDF processor.
+    image_url overrides the encoded image (see encode_image_for_ocr). With
+    tile (OCR_TILE_BANDS by default) tall tables are split into row bands
+    that are OCR'd concurrently and merged.
+
+    The image goes to OCR_FAST_MODEL first and only to OCR_MODEL when the
+    fast model's output fails validate_ocr_records. band tells that
+    image_url is one band of a tiled image, which may have no records.
     """
-    base64_image = encode_image_to_base64(image_path)
-    
-    prompt = """
+    client = client or get_ocr_client()
+    if image_url is None:
+        if tile is None:
+            tile = OCR_TILE_BANDS
+        if tile and OCR_PREPROCESSING != "legacy":
+            return _process_image_in_bands(image_path, client)
+        image_url = encode_image_for_ocr(image_path)
+
+    cache = get_ocr_cache()
+    models = ocr_models()
+    if cache is not None:
+        # An entry of any tier was accepted when it was stored
+        keys = {ocr_cache_key(image_url, model, OCR_PROMPT_VERSION): model for model in models}
+        key, records = cache.get_first(list(keys))
+        if records is not None:
+            logger.info(f"Using cached OCR of {image_path} ({keys[key]}): {len(records)} records")
+            return records
+
+    for tier, model in enumerate(models):
+        started = time.perf_counter()
+        records = _request_ocr(image_path, client, image_url, model)
+        if records:
+            records = repair_invalid_rows(image_path, client, image_url, records)
+        problems = ["request failed"] if records is None else validate_ocr_records(records, allow_empty=band)
+        last_tier = tier == len(models) - 1
+        ocr_tier_stats.record(tier, model, time.perf_counter() - started, bool(problems), last_tier)
+        if not problems or last_tier:
+            # Only accepted reads are cached; a failed one is retried next time
+            if records and not problems and cache is not None:
+                try:
+                    cache.put(ocr_cache_key(image_url, model, OCR_PROMPT_VERSION), records)
+                except OSError as e:
+                    logger.warning(f"Could not cache the OCR of {image_path}: {e}")
+            return records or []
+        logger.warning(f"{model} output for {image_path} failed validation ({'; '.join(problems[:3])}), "
+                       f"escalating to {models[tier + 1]}")
+
+OCR_PROMPT = """
 You are an expert OCR system for Spanish labor documents. Analyze this "INFORME DE VIDA LABORAL - SITUACIONES" document image and extract ONLY the relevant rows.
 
 DOCUMENT TABLE STRUCTURE:
@@ -94,17 +623,32 @@ For each relevant row:
 - isVacaciones: true if company contains "VACACIONES RETRIBUIDAS Y NO", false if "SERVICIO DE SALUD"
 - fechaAlta: Date from column 4 in DD/MM/YYYY format
 - fechaBaja: Date from column 6 in DD/MM/YYYY format (empty string if no date)
+- rowPosition: Vertical position of the middle of the row in the image, from 0.0 (top edge) to 1.0 (bottom edge)
 
 The response will be automatically structured according to the defined JSON schema.
+"""
+
+ROW_PROMPT = """
+This image is a horizontal strip cropped from the "SITUACIONES" table of a Spanish "INFORME DE VIDA LABORAL". Read ONLY the table row in the vertical middle of the strip and ignore rows cut by the top and bottom edges.
+
+The columns from LEFT TO RIGHT are: RÉGIMEN, CÓD. EMPRESA, EMPRESA, FECHA ALTA, FECHA EFECTO ALTA, FECHA DE BAJA, C.T., CTP %, G.C., DÍAS.
+
+- isVacaciones: true if EMPRESA contains "VACACIONES RETRIBUIDAS Y NO", false otherwise
+- fechaAlta: the FECHA ALTA column (the FIRST date of the row) in DD/MM/YYYY format
+- fechaBaja: the FECHA DE BAJA column (the THIRD date of the row, NOT the FECHA EFECTO ALTA right after FECHA ALTA) in DD/MM/YYYY format, empty string if there is none
+- rowPosition: 0.5
+
+A previous reading of this row gave {previous}, which is wrong: {problems}. Return exactly one record.
+"""
+
+def _request_ocr(image_path: str, client: OCRClient, image_url: str, model: str,
+                 prompt: str = OCR_PROMPT):
+    """
+    OCR one image with one model. Returns the records, or None when the
+    request or the parsing of the response fails.
     """
-    
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
     payload = {
-        "model": "mistralai/pixtral-large-2411",  # Mistral's vision model with OCR capabilities
+        "model": model,
         "messages": [
             {
                 "role": "user",
@@ -116,7 +660,7 @@ The response will be automatically structured according to the defined JSON sche
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
+                            "url": image_url
                         }
                     }
                 ]
@@ -147,9 +691,13 @@ The response will be automatically structured according to the defined JSON sche
                                     "fechaBaja": {
                                         "type": "string",
                                         "description": "End date in DD/MM/YYYY format, empty string if no end date"
+                                    },
+                                    "rowPosition": {
+                                        "type": "number",
+                                        "description": "Approximate vertical position of the row in the image, 0 (top) to 1 (bottom)"
                                     }
                                 },
-                                "required": ["isVacaciones", "fechaAlta", "fechaBaja"],
+                                "required": ["isVacaciones", "fechaAlta", "fechaBaja", "rowPosition"],
                                 "additionalProperties": False
                             }
                         }
@@ -167,7 +715,7 @@ The response will be automatically structured according to the defined JSON sche
         logger.info(f"Using API key: {OPENROUTER_API_KEY[:20]}...")
         logger.info(f"Payload model: {payload['model']}")
         
-        response = requests.post(OPENROUTER_URL, headers=headers, json=payload, timeout=60)
+        response = client.post(payload)
         logger.info(f"Response status: {response.status_code}")
         
         response.raise_for_status()
@@ -177,7 +725,7 @@ The response will be automatically structured according to the defined JSON sche
         
         if 'choices' not in result or not result['choices']:
             logger.error(f"No choices in response: {result}")
-            return []
+            return None
             
         content = result['choices'][0]['message']['content']
         logger.info(f"Raw API response content: {content[:500]}...")
@@ -204,7 +752,7 @@ The response will be automatically structured according to the defined JSON sche
             # Try to extract records from non-JSON response
             if "VACACIONES" in content or "SERVICIO DE SALUD" in content:
                 logger.warning("Found keywords in response, but couldn't parse JSON. Manual extraction needed.")
-            return []
+            return None
             
     except requests.exceptions.RequestException as e:
         logger.error(f"Error processing {image_path}: {e}")
@@ -214,13 +762,28 @@ The response will be automatically structured according to the defined JSON sche
                 logger.error(f"Error details: {error_details}")
             except:
                 logger.error(f"Error response text: {e.response.text[:500]}...")
-        return []
+        return None
+
+def find_duplicate_images(image_paths: List[str]) -> Dict[int, Dict]:
+    """
+    Near-duplicate images of a batch (see image_dedup.find_near_duplicates),
+    or no duplicates when OCR_DEDUP is off.
+    """
+    if not OCR_DEDUP:
+        return {}
+    duplicates = find_near_duplicates(image_paths)
+    for i, duplicate in duplicates.items():
+        logger.info(f"{image_paths[i]} is a near-duplicate of {image_paths[duplicate['duplicate_of']]} "
+                    f"({duplicate['distance']} bits), skipping its OCR")
+    return duplicates
 
 def process_all_images(images_dir: str = "data/imagenes") -> List[Dict]:
     """
     Process all images in the directory and combine results.
     Returns combined data in the same format as PDF processor.
     """
+    from ocr_pipeline import run_ocr_pipeline  # ocr_pipeline imports this module
+
     if not os.path.exists(images_dir):
         print(f"Images directory {images_dir} not found")
         return []
@@ -231,14 +794,30 @@ def process_all_images(images_dir: str = "data/imagenes") -> List[Dict]:
     
     print(f"Found {len(image_files)} images to process")
     
-    for image_file in image_files:
-        image_path = os.path.join(images_dir, image_file)
-        print(f"Processing {image_file}...")
-        
-        records = process_image_with_ocr(image_path)
+    image_paths = [os.path.join(images_dir, image_file) for image_file in image_files]
+    duplicates = find_duplicate_images(image_paths)
+    pipeline_results, pipeline_stats = run_ocr_pipeline(
+        [path for i, path in enumerate(image_paths) if i not in duplicates])
+    ocr_results = iter(ocr_records for ocr_records, _ in pipeline_results)
+    for i, image_file in enumerate(image_files):
+        if i in duplicates:
+            original = image_files[duplicates[i]['duplicate_of']]
+            print(f"Skipped {image_file}: near-duplicate of {original}")
+            continue
+        records = next(ocr_results)
+        print(f"Processed {image_file}: {len(records)} records")
         all_records.extend(records)
+    if duplicates:
+        print(f"Skipped {len(duplicates)} duplicate images")
     
     print(f"Total records extracted: {len(all_records)}")
+    print(f"OCR connections: {get_ocr_client().stats()}")
+    print(f"OCR model tiers: {ocr_tier_stats.stats()}")
+    for stage, stage_stats in pipeline_stats.items():
+        print(f"OCR {stage} stage: {stage_stats['items']} items in {stage_stats['seconds']}s "
+              f"({stage_stats['items_per_second']}/s, {stage_stats['utilization']} busy)")
+    if get_ocr_cache() is not None:
+        print(f"OCR cache: {get_ocr_cache().stats()}")
     
     # Summary statistics
     vacation_count = sum(1 for r in all_records if r.get('isVacaciones', False))
@@ -266,18 +845,16 @@ def format_date_for_output(date_str: str) -> str:
     except:
         return date_str
 
-def convert_ocr_to_extract_format(ocr_records: List[Dict]) -> List[Dict]:
+def convert_ocr_to_extract_format(ocr_records: List[Dict]) -> List[Record]:
     """
-    OCR records are already in the final format, just normalize dates.
+    Normalize the dates of the OCR records and convert them to Record objects.
     """
-    normalized_records = []
-    for record in ocr_records:
-        normalized_records.append({
-            "isVacaciones": record["isVacaciones"],
-            "fechaAlta": format_date_for_output(record["fechaAlta"]),
-            "fechaBaja": format_date_for_output(record["fechaBaja"])
-        })
-    return normalized_records
+    return [
+        Record.from_strings(record["isVacaciones"],
+                            format_date_for_output(record["fechaAlta"]),
+                            format_date_for_output(record["fechaBaja"]))
+        for record in ocr_records
+    ]
 
 if __name__ == "__main__":
     # Test the OCR processing
@@ -285,9 +862,9 @@ if __name__ == "__main__":
     formatted_data = convert_ocr_to_extract_format(records)
     
     print(f"\nProcessed {len(formatted_data)} relevant records")
-    print(f"Vacation records: {sum(1 for r in formatted_data if r['isVacaciones'])}")
-    print(f"Contract records: {sum(1 for r in formatted_data if not r['isVacaciones'])}")
+    print(f"Vacation records: {sum(1 for r in formatted_data if r.is_vacation)}")
+    print(f"Contract records: {sum(1 for r in formatted_data if not r.is_vacation)}")
     
     # Save test output
     with open("output/ocr_test_output.json", "w", encoding="utf-8") as f:
-        json.dump(formatted_data, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+        json.dump([r.to_dict() for r in formatted_data], f, ensure_ascii=False, indent=2)
\ No newline at end of file
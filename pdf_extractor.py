@@ -0,0 +1,449 @@
+"""
+Extraction of the 'SITUACIÓN/ES' tables of a vida laboral PDF.
+
+Two backends produce the same DataFrame:
+
+- "camelot": camelot's stream flavor (needs Ghostscript and OpenCV).
+- "text": reads the word coordinates straight from the PDF text layer with
+  pdfminer.six and bins them into the 10 columns, like extract_table.js.
+  It has no Ghostscript dependency and is much faster.
+
+Pages are processed independently in a shared process pool (see
+process_pool.py) and stitched back in page order; rows whose company name
+continues on the next page are joined while stitching, which is the only
+dependency between pages.
+"""
+import os
+import re
+import unicodedata
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from process_pool import get_process_pool
+
+COLUMNS = ["Regimen", "Codigo_Empresa", "Empresa", "Fecha_Alta", "Fecha_Efecto_Alta",
+           "Fecha_Baja", "C.T.", "CTP_%", "G.C.", "Dias"]
+DATE_COLUMNS = ["Fecha_Alta", "Fecha_Efecto_Alta", "Fecha_Baja"]
+
+BACKENDS = ("camelot", "text")
+
+# Bump whenever a change in this module changes the extracted rows, so
+# cached extractions (see extraction_cache.py) are not reused
+EXTRACTOR_VERSION = "1"
+
+_CODE = re.compile(r"[0-9]{6,}")
+_DATE = re.compile(r"[0-9]{2}\.[0-9]{2}\.[0-9]{4}")
+# Day counts, printed with a thousands dot from 1.000 on
+_DIAS = r"[0-9]{1,3}(?:\.[0-9]{3})*|[0-9]+"
+# Cells the report leaves blank or fills with dashes (e.g. "---" for no FECHA BAJA)
+_EMPTY_CELL = r"[-—–\s]*"
+
+
+def extract_situaciones(pdf_path, pages="auto", backend="camelot", workers=None):
+    """
+    Devuelve un DataFrame con cada fila de los cuadros 'SITUACIÓN/ES'
+    de un informe de vida laboral.
+
+    Parámetros
+    ----------
+    pdf_path : str
+        Ruta al PDF.
+    pages : str
+        Rango de páginas (1‑indexado).  Ej.: "all", "2-5", "2,3,4,5".
+        Con "auto" solo se procesan las páginas que contienen la cabecera
+        de SITUACIÓN/ES.
+    backend : str
+        "camelot" o "text" (capa de texto del PDF, sin Ghostscript).
+    workers : int | None
+        Procesos para repartir las páginas (por defecto, uno por CPU).
+        Con 1 todo se procesa en el proceso actual.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown PDF extraction backend: {backend}")
+
+    # En modo "auto" cada página se comprueba en su propio proceso, dentro
+    # del mismo análisis que luego extrae la tabla
+    detect = pages == "auto"
+    page_indexes = parse_pages("all" if detect else pages, _page_count(pdf_path))
+
+    if backend == "camelot":
+        return _extract_with_camelot(pdf_path, page_indexes, detect, workers)
+    return _extract_from_text_layer(pdf_path, page_indexes, detect, workers)
+
+
+def _page_count(pdf_path):
+    from pdfminer.pdfpage import PDFPage
+
+    with open(pdf_path, "rb") as f:
+        return sum(1 for _ in PDFPage.get_pages(f))
+
+
+def _map_pages(func, page_indexes, workers):
+    """
+    Run func(page_index) for every page and return the results in page
+    order, using the shared process pool when there are several pages.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if min(workers, len(page_indexes)) <= 1:
+        return [func(index) for index in page_indexes]
+    # The pool is sized by workers, not by the page count, so every PDF
+    # reuses the same one
+    return list(get_process_pool(workers).map(func, page_indexes))
+
+
+def _camelot_page_rows(pdf_path, page_index, detect=False):
+    if detect and not _is_situaciones_page(pdf_path, page_index):
+        return []
+
+    import camelot  # pip install "camelot‑py[cv]" ghostscript
+
+    tablas = camelot.read_pdf(pdf_path, pages=str(page_index + 1), flavor="stream")
+    # Normalizamos: quitamos saltos de línea y espacios extra
+    return [[" ".join(str(c).split()) for c in fila_raw]
+            for tabla in tablas for fila_raw in tabla.df.itertuples(index=False)]
+
+
+def _extract_with_camelot(pdf_path, page_indexes, detect=False, workers=None):
+    registros, corriente = [], None
+    page_rows = _map_pages(partial(_camelot_page_rows, pdf_path, detect=detect),
+                           page_indexes, workers)
+
+    # Las filas de continuación pueden caer al principio de la página
+    # siguiente, así que se unen al recorrer las páginas en orden
+    for filas in page_rows:
+        for fila in filas:
+            # Filtramos cabeceras y separadores
+            if (fila[0].upper().startswith(("RÉGIMEN", "SITUACIÓN"))
+                or fila[0] == "" and not fila[1].isdigit()):
+                continue
+
+            # Filas de continuación (la celda 0 viene vacía)
+            if fila[0] == "":
+                if corriente and fila[2]:
+                    corriente["Empresa"] += " " + fila[2]
+                continue
+
+            # Rellenamos celdas que falten para no romper el índice
+            while len(fila) < 10:
+                fila.append("")
+
+            corriente = dict(zip(COLUMNS, fila))
+            registros.append(corriente)
+
+    return pd.DataFrame(registros)
+
+
+# === Typed columns ==========================================================
+
+def normalize_situaciones(df):
+    """
+    Parse the text cells of an extracted table in columnar passes.
+
+    Returns (typed, invalid): typed is a copy of df where the DATE_COLUMNS
+    are datetime64 columns and Dias is an Int64 column, with missing values
+    for empty, dashed and invalid cells; invalid lists the table rows
+    (those with a company code) whose cells had text that couldn't be parsed,
+    as "row", "column", "value" and "Empresa" columns.
+    """
+    invalid_columns = ["row", "column", "value", "Empresa"]
+    if df.empty:
+        return df.copy(), pd.DataFrame(columns=invalid_columns)
+
+    typed = df.copy()
+    # All the date cells are parsed together as one flat column
+    cells = pd.Series(df[DATE_COLUMNS].to_numpy().ravel(), dtype=object).fillna("").astype(str).str.strip()
+    dates = pd.to_datetime(cells, format="%d.%m.%Y", errors="coerce")
+    bad_dates = (~cells.str.fullmatch(_EMPTY_CELL) & dates.isna()).to_numpy()
+    dates = dates.to_numpy().reshape(len(df), len(DATE_COLUMNS))
+    for i, column in enumerate(DATE_COLUMNS):
+        typed[column] = dates[:, i]
+
+    dias = df["Dias"].fillna("").astype(str).str.strip()
+    is_number = dias.str.fullmatch(_DIAS)
+    typed["Dias"] = pd.to_numeric(dias.where(is_number).str.replace(".", "", regex=False),
+                                  errors="coerce").astype("Int64")
+    bad_dias = (~dias.str.fullmatch(_EMPTY_CELL) & ~is_number).to_numpy()
+
+    # Cells of the other lines camelot returns (titles, names...) aren't reported
+    is_row = df["Codigo_Empresa"].fillna("").astype(str).str.fullmatch(_CODE.pattern).to_numpy()
+    bad = np.column_stack([bad_dates.reshape(len(df), len(DATE_COLUMNS)), bad_dias])
+    bad &= is_row[:, None]
+    rows, columns = np.nonzero(bad)
+    names = DATE_COLUMNS + ["Dias"]
+    raw = df[names].to_numpy()
+    invalid = pd.DataFrame({
+        "row": df.index.to_numpy()[rows],
+        "column": [names[c] for c in columns],
+        "value": raw[rows, columns],
+        "Empresa": df["Empresa"].to_numpy()[rows],
+    }, columns=invalid_columns)
+    return typed, invalid
+
+
+# === Page pre-filtering =====================================================
+
+def _compact(text):
+    return "".join(_normalize(text).split())
+
+
+def _is_situaciones_text(text):
+    text = _compact(text)
+    return "SITUACION/ES" in text or ("REGIMEN" in text and "FECHAALTA" in text)
+
+
+def _is_situaciones_page(pdf_path, page_index):
+    """
+    Cheap check over the raw characters of one page. The page is
+    interpreted without layout analysis (no LAParams), so its characters
+    are not grouped into lines and boxes before camelot parses it again.
+    """
+    from itertools import islice
+
+    from pdfminer.converter import PDFPageAggregator
+    from pdfminer.layout import LTChar
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    with open(pdf_path, "rb") as f:
+        page = next(islice(PDFPage.get_pages(f), page_index, None), None)
+        if page is None:
+            return False
+        resources = PDFResourceManager()
+        device = PDFPageAggregator(resources, laparams=None)
+        PDFPageInterpreter(resources, device).process_page(page)
+        layout = device.get_result()
+    return _is_situaciones_text("".join(item.get_text() for item in layout if isinstance(item, LTChar)))
+
+
+# === Text layer backend =====================================================
+
+def parse_pages(pages, page_count):
+    """Convert a camelot-style page spec ("all", "2-5", "1,3,4-6") to 0-based indexes."""
+    if pages == "all":
+        return list(range(page_count))
+    indexes = []
+    for part in str(pages).split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-")
+            last = page_count if last.strip() == "end" else int(last)
+            indexes.extend(range(int(first) - 1, min(last, page_count)))
+        elif part:
+            indexes.append(int(part) - 1)
+    return [i for i in indexes if 0 <= i < page_count]
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKD", text.upper())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+class _Word:
+    __slots__ = ("x0", "x1", "y", "height", "text")
+
+    def __init__(self, x0, x1, y, height, text):
+        self.x0 = x0
+        self.x1 = x1
+        self.y = y
+        self.height = height
+        self.text = text
+
+    @property
+    def center(self):
+        return (self.x0 + self.x1) / 2
+
+
+def _text_lines(layout):
+    from pdfminer.layout import LTTextContainer, LTTextLine
+
+    stack = [layout]
+    while stack:
+        element = stack.pop()
+        if isinstance(element, LTTextLine):
+            yield element
+        elif isinstance(element, LTTextContainer) or hasattr(element, "__iter__"):
+            stack.extend(element)
+
+
+def _page_words(layout):
+    """Split the text lines of a page into words with their coordinates."""
+    from pdfminer.layout import LTChar
+
+    words = []
+    for line in _text_lines(layout):
+        chars = []
+        for obj in list(line) + [None]:
+            is_char = isinstance(obj, LTChar) and obj.get_text().strip()
+            # A space, a virtual space or a visible gap ends the current word
+            if chars and (not is_char or obj.x0 - chars[-1].x1 > obj.size * 0.3):
+                words.append(_Word(chars[0].x0, chars[-1].x1,
+                                   (min(c.y0 for c in chars) + max(c.y1 for c in chars)) / 2,
+                                   max(c.y1 - c.y0 for c in chars),
+                                   "".join(c.get_text() for c in chars)))
+                chars = []
+            if is_char:
+                chars.append(obj)
+    return words
+
+
+def _group_lines(words):
+    """Group words into visual lines, top to bottom, each sorted left to right."""
+    lines = []
+    for word in sorted(words, key=lambda w: -w.y):
+        if lines and abs(lines[-1][0].y - word.y) <= max(word.height, 1) * 0.4:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    return [sorted(line, key=lambda w: w.x0) for line in lines]
+
+
+def _data_row_code(line):
+    """
+    Index of the company code in a table row, or None for other lines.
+    Table rows have the regime, then the code and a FECHA ALTA date after it.
+    """
+    for i, word in enumerate(line):
+        if _DATE.fullmatch(word.text):
+            return None
+        if i > 0 and _CODE.fullmatch(word.text):
+            if any(_DATE.fullmatch(w.text) for w in line[i + 1:]):
+                return i
+            return None
+    return None
+
+
+def _header_columns(lines):
+    """
+    X centers of the FECHA ALTA ... DÍAS header cells, or None when the
+    page has no complete header.
+    """
+    fechas, others = [], {}
+    for line in lines:
+        if _data_row_code(line) is not None:
+            break
+        for word in line:
+            label = _normalize(word.text)
+            if label == "FECHA" and all(abs(word.center - x) > word.height for x in fechas):
+                fechas.append(word.center)
+            elif label in ("C.T.", "CTP", "G.C.", "DIAS"):
+                others.setdefault(label, word.center)
+
+    if len(fechas) != 3 or len(others) != 4:
+        return None
+    return sorted(fechas) + [others[k] for k in ("C.T.", "CTP", "G.C.", "DIAS")]
+
+
+def _split_cells(line, code_index, columns):
+    fila = [" ".join(w.text for w in line[:code_index]), line[code_index].text] + [""] * 8
+    rest = line[code_index + 1:]
+
+    if columns is None:
+        # Without a header, the company name runs up to the first date and
+        # the remaining cells follow in order
+        first_date = next((i for i, w in enumerate(rest) if _DATE.fullmatch(w.text)), len(rest))
+        fila[2] = " ".join(w.text for w in rest[:first_date])
+        for i, word in enumerate(rest[first_date:first_date + 7]):
+            fila[3 + i] = word.text
+        return fila
+
+    # Cells 3-9 are binned around the header centers; anything before the
+    # FECHA ALTA cell belongs to the company name
+    edges = [columns[0] - (columns[1] - columns[0]) / 2]
+    edges += [(a + b) / 2 for a, b in zip(columns, columns[1:])]
+    empresa = []
+    for word in rest:
+        column = sum(1 for edge in edges if word.center >= edge)
+        if column == 0:
+            empresa.append(word.text)
+        else:
+            cell = 2 + column
+            fila[cell] = f"{fila[cell]} {word.text}".strip()
+    fila[2] = " ".join(empresa)
+    return fila
+
+
+_HEADER_WORDS = {"REGIMEN", "EMPRESA", "SITUACION", "ASIMILADA", "FECHA", "EFECTO", "ALTA",
+                 "BAJA", "C.T.", "CTP", "G.C.", "DIAS"}
+
+
+def _text_page_lines(pdf_path, page_index, detect=False):
+    """Layout analysis of one page, the expensive part of the text backend."""
+    from pdfminer.high_level import extract_pages
+
+    for layout in extract_pages(pdf_path, page_numbers=[page_index]):
+        lines = _group_lines(_page_words(layout))
+        if detect and not _is_situaciones_text("".join(w.text for line in lines for w in line)):
+            return []
+        return lines
+    return []
+
+
+def _extract_from_text_layer(pdf_path, page_indexes, detect=False, workers=None):
+    registros, state = [], _TableState()
+    page_lines = _map_pages(partial(_text_page_lines, pdf_path, detect=detect),
+                            page_indexes, workers)
+    for lines in page_lines:
+        state.columns = _header_columns(lines) or state.columns
+        registros.extend(_rows_from_lines(lines, state))
+
+    return pd.DataFrame(registros, columns=COLUMNS if registros else None)
+
+
+class _TableState:
+    """What a page needs from the previous one: the columns and the last row."""
+    __slots__ = ("columns", "corriente", "name_left", "name_right")
+
+    def __init__(self):
+        self.columns = None
+        self.corriente = None
+        self.name_left = None
+        self.name_right = None
+
+
+def _rows_from_lines(lines, state):
+    """
+    Turn the lines of one page into row dicts. Lines below a row that only
+    hold words in the company column continue its name, as in camelot, also
+    when they are the first lines after the header of the next page.
+    """
+    registros = []
+    in_table = False
+    last_y = None
+
+    for line in lines:
+        code_index = _data_row_code(line)
+        if code_index is not None:
+            fila = _split_cells(line, code_index, state.columns)
+            state.corriente = dict(zip(COLUMNS, fila))
+            registros.append(state.corriente)
+            in_table = True
+            last_y = line[0].y
+            state.name_left = line[code_index].x1
+            if state.columns:
+                state.name_right = state.columns[0] - (state.columns[1] - state.columns[0]) / 2
+            continue
+
+        if not registros and any(_normalize(w.text) in _HEADER_WORDS for w in line):
+            # Rows continued from the previous page start right below the header
+            in_table = not registros and state.corriente is not None
+            last_y = line[0].y
+            continue
+
+        if not in_table:
+            continue
+
+        height = max(w.height for w in line)
+        in_name_column = all(
+            w.x0 >= state.name_left and (state.name_right is None or w.center < state.name_right)
+            for w in line)
+        if in_name_column and last_y - line[0].y <= height * 2.5:
+            state.corriente["Empresa"] += " " + " ".join(w.text for w in line)
+            last_y = line[0].y
+        else:
+            # Footer, totals or anything else ends the table on this page
+            in_table = False
+
+    return registros
@@ -0,0 +1,32 @@
+"""
+Long-lived process pools shared by the PDF extraction and the OCR
+preprocessing.
+
+Both run from Flask request and job threads. Forking a multi-threaded
+process can leave the child holding a lock (e.g. the logging lock) that
+another thread had at fork time, hanging it forever, so the workers are
+started through forkserver (spawn where it isn't available) instead. The
+pools are created once per size and reused, since starting those workers
+is slow.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def _context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def get_process_pool(workers):
+    """The shared pool with the given number of worker processes."""
+    with _lock:
+        pool = _pools.get(workers)
+        # A worker that died leaves the pool unusable
+        if pool is None or pool._broken:
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=_context())
+        return pool
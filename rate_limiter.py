@@ -0,0 +1,160 @@
+"""
+Rate limiter for the OCR API shared by every process on the host.
+
+Several app.py workers (and CLI runs) send requests to the same OpenRouter
+account, so limiting each process on its own still lets a burst of uploads
+exceed the account's rate limit. The limiter keeps its state in a SQLite
+database that all processes open:
+
+- a token bucket (rate tokens per second, up to burst) that every request
+  takes one token from,
+- leases of the requests in flight, capped at max_in_flight,
+- a FIFO queue of waiting requests, so they are served in arrival order
+  across processes instead of whoever polls first.
+
+Leases and queue entries of crashed processes expire, so they can't block
+the others forever.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds a request may hold its slot before it is considered dead
+LEASE_TIMEOUT = 300
+# Queue entries not polled for this long belong to a dead process
+STALE_WAITER = 10
+POLL_INTERVAL = 0.05
+
+
+class SharedRateLimiter:
+    """Token bucket and concurrency cap stored in a SQLite database."""
+
+    def __init__(self, path, rate, burst=None, max_in_flight=8):
+        self.path = path
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.max_in_flight = max_in_flight
+        self.waited = 0.0
+        self.acquired = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS bucket (id INTEGER PRIMARY KEY CHECK (id = 1), "
+                       "tokens REAL NOT NULL, updated REAL NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS waiters (ticket INTEGER PRIMARY KEY AUTOINCREMENT, "
+                       "pid INTEGER NOT NULL, seen REAL NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS leases (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                       "pid INTEGER NOT NULL, expires REAL NOT NULL)")
+            db.execute("INSERT OR IGNORE INTO bucket VALUES (1, ?, ?)", (self.burst, time.time()))
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        return _Transactions(db)
+
+    def _refill(self, db, now):
+        tokens, updated = db.execute("SELECT tokens, updated FROM bucket WHERE id = 1").fetchone()
+        tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+        db.execute("UPDATE bucket SET tokens = ?, updated = ? WHERE id = 1", (tokens, now))
+        return tokens
+
+    def acquire(self):
+        """Wait for a slot; returns the lease id to pass to release()."""
+        started = time.monotonic()
+        with self._connect() as db:
+            with db.transaction():
+                ticket = db.execute("INSERT INTO waiters (pid, seen) VALUES (?, ?)",
+                                    (os.getpid(), time.time())).lastrowid
+            try:
+                while True:
+                    with db.transaction():
+                        now = time.time()
+                        db.execute("DELETE FROM waiters WHERE seen < ?", (now - STALE_WAITER,))
+                        db.execute("DELETE FROM leases WHERE expires < ?", (now,))
+                        db.execute("UPDATE waiters SET seen = ? WHERE ticket = ?", (now, ticket))
+                        head = db.execute("SELECT MIN(ticket) FROM waiters").fetchone()[0]
+                        tokens = self._refill(db, now)
+                        in_flight = db.execute("SELECT COUNT(*) FROM leases").fetchone()[0]
+                        if head == ticket and tokens >= 1 and in_flight < self.max_in_flight:
+                            db.execute("UPDATE bucket SET tokens = tokens - 1 WHERE id = 1")
+                            db.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+                            lease = db.execute("INSERT INTO leases (pid, expires) VALUES (?, ?)",
+                                               (os.getpid(), now + LEASE_TIMEOUT)).lastrowid
+                            ticket = None
+                            break
+                    # The head of the queue sleeps until its next token is due
+                    wait = (1 - tokens) / self.rate if head == ticket and tokens < 1 else POLL_INTERVAL
+                    time.sleep(min(max(wait, 0.01), 0.25))
+            finally:
+                if ticket is not None:
+                    with db.transaction():
+                        db.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+
+        with self._lock:
+            self.acquired += 1
+            self.waited += time.monotonic() - started
+        return lease
+
+    def release(self, lease):
+        with self._connect() as db:
+            with db.transaction():
+                db.execute("DELETE FROM leases WHERE id = ?", (lease,))
+
+    @contextmanager
+    def slot(self):
+        """Hold a rate-limited slot for the duration of one request."""
+        lease = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(lease)
+
+    def stats(self):
+        """Queue depth and requests in flight across all processes, plus this process's waits."""
+        with self._connect() as db:
+            now = time.time()
+            waiting = db.execute("SELECT COUNT(*) FROM waiters WHERE seen >= ?",
+                                 (now - STALE_WAITER,)).fetchone()[0]
+            in_flight = db.execute("SELECT COUNT(*) FROM leases WHERE expires >= ?", (now,)).fetchone()[0]
+            tokens, updated = db.execute("SELECT tokens, updated FROM bucket WHERE id = 1").fetchone()
+        with self._lock:
+            acquired, waited = self.acquired, self.waited
+        return {
+            "queue_depth": waiting,
+            "in_flight": in_flight,
+            "max_in_flight": self.max_in_flight,
+            "tokens": round(min(self.burst, tokens + max(0.0, now - updated) * self.rate), 2),
+            "rate": self.rate,
+            "acquired": acquired,
+            "mean_wait_seconds": round(waited / acquired, 3) if acquired else None
+        }
+
+
+class _Transactions:
+    """A SQLite connection with write-locked transactions, closed on exit."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.db.close()
+
+    def execute(self, sql, params=()):
+        return self.db.execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        # IMMEDIATE takes the write lock up front, so the read-modify-write
+        # of the bucket can't interleave with another process
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
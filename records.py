@@ -0,0 +1,166 @@
+"""
+Compact representation of the vacation and contract periods.
+
+Records store their dates as integer day ordinals from extraction through
+the calculation; they are only converted back to DD/MM/YYYY strings at the
+JSON and Excel boundaries. Dates that can't be parsed (typically misread by
+the OCR) keep their original text, so the user sees it in the editor and can
+correct it instead of getting an empty date.
+"""
+import datetime
+import re
+
+import numpy as np
+
+DATE_FORMAT = "%d/%m/%Y"
+
+# Ordinal used for dates that were present but couldn't be parsed
+INVALID_DATE = 0
+
+VACATION_PREFIX = "VACACIONES RETRIBUIDAS Y NO"
+CONTRACT_PREFIX = "SERVICIO DE SALUD DEL PRINCIPADO"
+
+_DATE_PATTERNS = {
+    "/": re.compile(r"([0-9]{1,2})/([0-9]{1,2})/([0-9]{4})"),
+    ".": re.compile(r"([0-9]{1,2})\.([0-9]{1,2})\.([0-9]{4})"),
+}
+
+
+def parse_date(date_str, separator="/"):
+    """Parse a DD/MM/YYYY (or DD.MM.YYYY) string into a day ordinal, or None if invalid."""
+    if not date_str or not isinstance(date_str, str):
+        return None
+    match = _DATE_PATTERNS[separator].fullmatch(date_str)
+    if match is None:
+        return None
+    day, month, year = match.groups()
+    try:
+        return datetime.date(int(year), int(month), int(day)).toordinal()
+    except ValueError:
+        return None
+
+
+def format_ordinal(ordinal):
+    """Format a day ordinal as a DD/MM/YYYY string; missing or invalid dates become ""."""
+    if not ordinal:
+        return ""
+    d = datetime.date.fromordinal(ordinal)
+    return f"{d.day:02d}/{d.month:02d}/{d.year:04d}"
+
+
+def _to_ordinal(date_str, separator="/"):
+    if not date_str:
+        return None
+    ordinal = parse_date(date_str, separator)
+    return INVALID_DATE if ordinal is None else ordinal
+
+
+def _invalid_text(ordinal, date_str):
+    return date_str if ordinal == INVALID_DATE else None
+
+
+class Record:
+    """
+    A vacation or contract period.
+
+    start and end are day ordinals, None when the date is missing and
+    INVALID_DATE when it was present but couldn't be parsed; start_text and
+    end_text then hold the text that couldn't be parsed.
+    """
+    __slots__ = ("is_vacation", "start", "end", "start_text", "end_text")
+
+    def __init__(self, is_vacation, start=None, end=None, start_text=None, end_text=None):
+        self.is_vacation = is_vacation
+        self.start = start
+        self.end = end
+        self.start_text = start_text
+        self.end_text = end_text
+
+    def __repr__(self):
+        kind = "vacation" if self.is_vacation else "contract"
+        return f"Record({kind}, {self._format_start()!r}, {self._format_end()!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Record):
+            return NotImplemented
+        return (self.is_vacation, self.start, self.end) == (other.is_vacation, other.start, other.end)
+
+    @classmethod
+    def from_strings(cls, is_vacation, fecha_alta, fecha_baja, separator="/"):
+        start, end = _to_ordinal(fecha_alta, separator), _to_ordinal(fecha_baja, separator)
+        return cls(bool(is_vacation), start, end, _invalid_text(start, fecha_alta), _invalid_text(end, fecha_baja))
+
+    @classmethod
+    def from_dict(cls, item):
+        """Build a record from an {"isVacaciones"/"type", "fechaAlta", "fechaBaja"} dict."""
+        if "isVacaciones" in item:
+            is_vacation = item["isVacaciones"]
+        else:
+            is_vacation = item["type"] == "vacation"
+        return cls.from_strings(is_vacation, item["fechaAlta"], item["fechaBaja"])
+
+    def interval(self, today):
+        """
+        Return (is_vacation, start, end) for the calculation, or None for
+        records with missing, invalid or inverted dates. Contracts without
+        an end date are considered active until today.
+        """
+        start, end = self.start, self.end
+        if not start:
+            return None
+        if end is None and not self.is_vacation:
+            end = today
+        if not end or end < start:
+            return None
+        return self.is_vacation, start, end
+
+    def _format_start(self):
+        return self.start_text if self.start == INVALID_DATE and self.start_text else format_ordinal(self.start)
+
+    def _format_end(self):
+        return self.end_text if self.end == INVALID_DATE and self.end_text else format_ordinal(self.end)
+
+    def to_dict(self):
+        return {
+            "isVacaciones": self.is_vacation,
+            "fechaAlta": self._format_start(),
+            "fechaBaja": self._format_end()
+        }
+
+    def to_editor_dict(self):
+        """Format used by the web editor; invalid dates keep their original text"""
+        return {
+            "type": "vacation" if self.is_vacation else "contract",
+            "fechaAlta": self._format_start(),
+            "fechaBaja": self._format_end()
+        }
+
+
+# Day ordinal of the datetime64 epoch (1970-01-01)
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def _datetime64_to_ordinals(values):
+    days = np.asarray(values, dtype="datetime64[D]")
+    ordinals = days.astype(np.int64) + _EPOCH_ORDINAL
+    return [None if missing else ordinal
+            for ordinal, missing in zip(ordinals.tolist(), np.isnat(days).tolist())]
+
+
+def records_from_situaciones(df):
+    """
+    Keep the vacation and health service contract rows of a SITUACIONES
+    DataFrame typed by pdf_extractor.normalize_situaciones as records.
+    """
+    if df.empty:
+        return []
+
+    empresa = df["Empresa"].astype(str)
+    is_vacation = empresa.str.startswith(VACATION_PREFIX).to_numpy()
+    keep = is_vacation | empresa.str.startswith(CONTRACT_PREFIX).to_numpy()
+
+    # Dates that can't be parsed in the PDF are NaT and treated as missing
+    starts = _datetime64_to_ordinals(df["Fecha_Alta"].to_numpy()[keep])
+    ends = _datetime64_to_ordinals(df["Fecha_Baja"].to_numpy()[keep])
+    return [Record(vacation, start, end)
+            for vacation, start, end in zip(is_vacation[keep].tolist(), starts, ends)]
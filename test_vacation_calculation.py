@@ -1,104 +1,25 @@
 import datetime
-import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 
-def calculate_non_overlapping_vacation_days(data):
-    """
-    Calculate vacation days that don't overlap with contract periods.
-    Returns both the total days and the specific non-overlapping periods.
-    """
-    vacations = [item for item in data if item["isVacaciones"]]
-    contracts = [item for item in data if not item["isVacaciones"]]
-    
-    total_non_overlapping_days = 0
-    non_overlapping_periods = []
-    
-    for vacation in vacations:
-        if not vacation["fechaAlta"] or not vacation["fechaBaja"]:
-            continue
-            
-        try:
-            vac_start = datetime.datetime.strptime(vacation["fechaAlta"], "%d/%m/%Y")
-            vac_end = datetime.datetime.strptime(vacation["fechaBaja"], "%d/%m/%Y")
-        except ValueError:
-            continue
-            
-        # Find overlapping contracts
-        overlapping_periods = []
-        
-        for contract in contracts:
-            if not contract["fechaAlta"]:
-                continue
-                
-            try:
-                contract_start = datetime.datetime.strptime(contract["fechaAlta"], "%d/%m/%Y")
-                # If contract has no end date, assume it's still active (use today)
-                if contract["fechaBaja"]:
-                    contract_end = datetime.datetime.strptime(contract["fechaBaja"], "%d/%m/%Y")
-                else:
-                    contract_end = datetime.datetime.now()
-                    
-                # Check if vacation overlaps with contract
-                if vac_start <= contract_end and vac_end >= contract_start:
-                    # Calculate overlapping period
-                    overlap_start = max(vac_start, contract_start)
-                    overlap_end = min(vac_end, contract_end)
-                    overlapping_periods.append((overlap_start, overlap_end))
-                    
-            except ValueError:
-                continue
-        
-        # Calculate non-overlapping periods for this vacation
-        if not overlapping_periods:
-            # No overlap, count all vacation days
-            vacation_days = (vac_end - vac_start).days + 1
-            total_non_overlapping_days += vacation_days
-            non_overlapping_periods.append({
-                "start": vac_start.strftime("%d/%m/%Y"),
-                "end": vac_end.strftime("%d/%m/%Y"),
-                "days": vacation_days
-            })
-        else:
-            # Merge overlapping periods and calculate non-overlapping segments
-            overlapping_periods.sort()
-            merged_overlaps = []
-            
-            for overlap in overlapping_periods:
-                if not merged_overlaps or merged_overlaps[-1][1] < overlap[0]:
-                    merged_overlaps.append(overlap)
-                else:
-                    merged_overlaps[-1] = (merged_overlaps[-1][0], max(merged_overlaps[-1][1], overlap[1]))
-            
-            # Find non-overlapping segments within this vacation
-            current_pos = vac_start
-            
-            for overlap_start, overlap_end in merged_overlaps:
-                # Add period before this overlap (if any)
-                if current_pos < overlap_start:
-                    segment_end = overlap_start - datetime.timedelta(days=1)
-                    segment_days = (segment_end - current_pos).days + 1
-                    if segment_days > 0:
-                        total_non_overlapping_days += segment_days
-                        non_overlapping_periods.append({
-                            "start": current_pos.strftime("%d/%m/%Y"),
-                            "end": segment_end.strftime("%d/%m/%Y"),
-                            "days": segment_days
-                        })
-                
-                # Move current position past this overlap
-                current_pos = overlap_end + datetime.timedelta(days=1)
-            
-            # Add remaining period after all overlaps (if any)
-            if current_pos <= vac_end:
-                segment_days = (vac_end - current_pos).days + 1
-                if segment_days > 0:
-                    total_non_overlapping_days += segment_days
-                    non_overlapping_periods.append({
-                        "start": current_pos.strftime("%d/%m/%Y"),
-                        "end": vac_end.strftime("%d/%m/%Y"),
-                        "days": segment_days
-                    })
-    
-    return total_non_overlapping_days, non_overlapping_periods
+import pandas as pd
+
+import extraction_cache
+
+from calculation_session import CalculationSession
+from extraction_cache import ExtractionCache, cache_key
+from ocr_processor import convert_ocr_to_extract_format, merge_band_records, record_problems, validate_ocr_records
+from pdf_extractor import COLUMNS, extract_situaciones, normalize_situaciones
+from records import Record
+from vacation_timeline import VacationTimeline
+from vacation_calculator import (
+    calculate_non_overlapping_vacation_days,
+    calculate_batch_non_overlapping_vacation_days,
+    records_to_arrays,
+)
 
 def run_test_case(name, data, expected_result, expected_periods=None):
     """Run a single test case and return the result."""
@@ -113,11 +34,11 @@ def run_test_case(name, data, expected_result, expected_periods=None):
             print(f"  {period['start']} to {period['end']} ({period['days']} days)")
     
     if total_days == expected_result:
-        if expected_periods is None or len(periods) == len(expected_periods):
+        if expected_periods is None or periods == expected_periods:
             print("✅ PASS")
             return True
         else:
-            print("❌ FAIL - Period count mismatch")
+            print("❌ FAIL - Period mismatch")
             return False
     else:
         print("❌ FAIL - Day count mismatch")
@@ -126,6 +47,238 @@ def run_test_case(name, data, expected_result, expected_periods=None):
             print(f"  {item}")
         return False
 
+def run_batch_test_case(name, records_by_worker):
+    """Run the batch calculation and compare it with the per-worker results."""
+    print(f"\n--- Test Case: {name} ---")
+    results = calculate_batch_non_overlapping_vacation_days(*records_to_arrays(records_by_worker))
+
+    mismatches = []
+    for worker_id, data in records_by_worker.items():
+        expected = calculate_non_overlapping_vacation_days(data)
+        if results.get(worker_id, (0, [])) != expected:
+            mismatches.append(worker_id)
+
+    print(f"Workers: {len(records_by_worker)}, mismatches: {len(mismatches)}")
+    if not mismatches:
+        print("✅ PASS")
+        return True
+    print(f"❌ FAIL - Batch mismatch for {', '.join(mismatches)}")
+    return False
+
+def run_session_test_case(name, data, changes, expected_data):
+    """Apply row changes to a calculation session and compare with a full recalculation."""
+    print(f"\n--- Test Case: {name} ---")
+    session = CalculationSession(list(enumerate(data)))
+    changed = session.apply(changes)
+    expected_total, expected_periods = calculate_non_overlapping_vacation_days(expected_data)
+    print(f"Expected days: {expected_total}, Got: {session.total}")
+    print(f"Rows with changed periods: {sorted(changed)}")
+
+    if session.total == expected_total and session.periods() == expected_periods:
+        print("✅ PASS")
+        return True
+    print("❌ FAIL - Session results differ from full recalculation")
+    return False
+
+def run_timeline_test_case(name, data, queries):
+    """Check (start, end, expected_uncovered, expected_covered) range queries on a timeline."""
+    print(f"\n--- Test Case: {name} ---")
+    timeline = VacationTimeline(data)
+
+    passed = True
+    for start, end, expected_uncovered, expected_covered in queries:
+        result = timeline.query(start, end)
+        print(f"  {start or '...'} to {end or '...'}: "
+              f"uncovered {result['uncovered_days']} (expected {expected_uncovered}), "
+              f"covered {result['covered_days']} (expected {expected_covered})")
+        if (result['uncovered_days'], result['covered_days']) != (expected_uncovered, expected_covered):
+            passed = False
+
+    print("✅ PASS" if passed else "❌ FAIL - Range query mismatch")
+    return passed
+
+def write_report_pdf(path, pages):
+    """Write a minimal PDF with one Helvetica 8pt text run per (x, y, text) on each page."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for runs in pages:
+        stream = b"".join(b"BT /F1 8 Tf %d %d Td (%s) Tj ET\n" % (x, y, text.encode("cp1252"))
+                          for x, y, text in runs)
+        objects.append(b"<< /Length %d >>\nstream\n%sendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 650 400] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    pdf, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(pdf)
+
+def run_pdf_extraction_test_case(name, pages, expected_rows, **options):
+    """Extract a generated report with the text backend and compare its rows."""
+    print(f"\n--- Test Case: {name} ---")
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        write_report_pdf(path, pages)
+        rows = extract_situaciones(path, backend="text", **options).values.tolist()
+    finally:
+        os.remove(path)
+
+    print(f"Expected rows: {len(expected_rows)}, Got: {len(rows)}")
+    if rows == expected_rows:
+        print("✅ PASS")
+        return True
+    print("❌ FAIL - Row mismatch")
+    for row in rows:
+        print(f"  {row}")
+    return False
+
+def run_normalize_test_case(name, rows, expected_dias, expected_invalid):
+    """Type an extracted table and compare its Dias column and invalid cells."""
+    print(f"\n--- Test Case: {name} ---")
+    typed, invalid = normalize_situaciones(pd.DataFrame(rows, columns=COLUMNS))
+    dias = [None if pd.isna(value) else int(value) for value in typed["Dias"]]
+    invalid_cells = list(zip(invalid["row"], invalid["column"], invalid["value"]))
+    print(f"Expected Dias: {expected_dias}, Got: {dias}")
+    print(f"Expected invalid cells: {expected_invalid}, Got: {invalid_cells}")
+
+    if dias == expected_dias and invalid_cells == expected_invalid:
+        print("✅ PASS")
+        return True
+    print("❌ FAIL - Typed table mismatch")
+    return False
+
+def run_ocr_validation_test_case(name, cases):
+    """Check (label, function, args, kwargs, expected problems) cases of the OCR output checks."""
+    print(f"\n--- Test Case: {name} ---")
+    passed = True
+    for label, function, args, kwargs, expected in cases:
+        problems = function(*args, **kwargs)
+        print(f"  {label}: {problems} (expected {expected})")
+        if problems != expected:
+            passed = False
+
+    print("✅ PASS" if passed else "❌ FAIL - Problems mismatch")
+    return passed
+
+def band_record(row, band, fechaBaja=None):
+    """OCR record of table row `row` (rows are 100 px high) as read in a band (top, bottom)."""
+    top, bottom = band
+    return {"isVacaciones": row % 2 == 0, "fechaAlta": f"{row + 1:02d}/01/2020",
+            "fechaBaja": fechaBaja or f"{row + 1:02d}/02/2020",
+            "rowPosition": round((row * 100 + 50 - top) / (bottom - top), 3)}
+
+def run_band_merge_test_case(name, band_records, bounds, expected_rows):
+    """Merge band records and compare the fechaAlta of the rows kept, top to bottom."""
+    print(f"\n--- Test Case: {name} ---")
+    merged = merge_band_records(band_records, bounds)
+    rows = [record["fechaAlta"] for record in merged]
+    print(f"Expected rows: {expected_rows}")
+    print(f"Got rows:      {rows}")
+    positions = [record["rowPosition"] for record in merged]
+    if rows == expected_rows and positions == sorted(positions):
+        print("✅ PASS")
+        return True
+    print("❌ FAIL - Merged rows mismatch")
+    return False
+
+def run_extraction_cache_test_case(name, check):
+    """
+    Run check(cache, pdf_paths, extractions) against an ExtractionCache in a
+    temporary directory, with extract_situaciones replaced by a slow fake
+    that counts its calls. check returns a list of failure messages.
+    """
+    print(f"\n--- Test Case: {name} ---")
+    directory = tempfile.mkdtemp()
+    extractions = []
+
+    def fake_extract(pdf_path, pages="auto", backend="camelot", workers=None):
+        extractions.append(pdf_path)
+        time.sleep(0.2)
+        return pd.DataFrame([[os.path.basename(pdf_path), "1"]], columns=["Empresa", "Dias"])
+
+    original = extraction_cache.extract_situaciones
+    extraction_cache.extract_situaciones = fake_extract
+    try:
+        pdf_paths = []
+        for i in range(3):
+            path = os.path.join(directory, f"report_{i}.pdf")
+            with open(path, "wb") as f:
+                f.write(f"report {i}".encode("utf-8"))
+            pdf_paths.append(path)
+        failures = check(ExtractionCache(os.path.join(directory, "cache"), max_bytes=1024),
+                         pdf_paths, extractions)
+    finally:
+        extraction_cache.extract_situaciones = original
+        shutil.rmtree(directory)
+
+    for failure in failures:
+        print(f"  {failure}")
+    print("✅ PASS" if not failures else "❌ FAIL - Cache behaviour mismatch")
+    return not failures
+
+def check_cache_hits(cache, pdf_paths, extractions):
+    first, first_cached = cache.extract(pdf_paths[0])
+    second, second_cached = cache.extract(pdf_paths[0])
+    print(f"Cached: {first_cached}, {second_cached}; hits {cache.hits}, misses {cache.misses}")
+    failures = []
+    if (first_cached, second_cached) != (False, True) or (cache.hits, cache.misses) != (1, 1):
+        failures.append("expected a miss then a hit")
+    if len(extractions) != 1 or not first.equals(second):
+        failures.append("the cached table differs or the PDF was extracted twice")
+    return failures
+
+def check_cache_eviction(cache, pdf_paths, extractions):
+    # Each entry takes about 65 bytes, so only the two most recent fit
+    cache.max_bytes = 150
+    for path in pdf_paths:
+        cache.extract(path)
+        time.sleep(0.05)  # distinct modification times
+    kept = [cache.get(cache_key(path, "camelot")) is not None for path in pdf_paths]
+    size = sum(os.path.getsize(os.path.join(cache.directory, name)) for name in os.listdir(cache.directory))
+    print(f"Entries kept: {kept}, cache size: {size} bytes")
+    failures = []
+    if size > cache.max_bytes:
+        failures.append("cache exceeds max_bytes")
+    if kept != [False, True, True]:
+        failures.append("expected the least recently used entry to be evicted")
+    return failures
+
+def check_cache_single_flight(cache, pdf_paths, extractions):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.extract(pdf_paths[0])))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"Extractions: {len(extractions)}, cached flags: {sorted(cached for _, cached in results)}")
+    failures = []
+    if len(extractions) != 1 or sorted(cached for _, cached in results) != [False, True]:
+        failures.append("expected one extraction shared by both callers")
+    return failures
+
+def check_cache_write_error(cache, pdf_paths, extractions):
+    def failing_put(key, df):
+        raise OSError("No space left on device")
+
+    cache.put = failing_put
+    try:
+        df, cached = cache.extract(pdf_paths[0])
+    except OSError as e:
+        return [f"extract raised {e!r}"]
+    print(f"Rows: {len(df)}, cached: {cached}")
+    return [] if len(df) == 1 and not cached else ["expected the extracted table"]
+
 def run_all_tests():
     """Run all test cases."""
     total_tests = 0
@@ -238,7 +391,221 @@ def run_all_tests():
     total_tests += 1
     if run_test_case("Multiple vacations mixed overlaps", test10_data, 11):
         passed_tests += 1
-    
+
+    # Test Case 11: Unsorted input with many short contracts inside one vacation
+    test11_data = [
+        {"isVacaciones": False, "fechaAlta": "20/01/2020", "fechaBaja": "21/01/2020"},  # contract 3
+        {"isVacaciones": True, "fechaAlta": "01/01/2020", "fechaBaja": "31/01/2020"},  # 31 days vacation
+        {"isVacaciones": False, "fechaAlta": "10/01/2020", "fechaBaja": "11/01/2020"},  # contract 2
+        {"isVacaciones": False, "fechaAlta": "02/01/2020", "fechaBaja": "03/01/2020"}   # contract 1
+    ]
+    # Contracts cover 6 days, leaving 01/01, 04-09/01, 12-19/01 and 22-31/01
+    expected_periods_11 = [
+        {"start": "01/01/2020", "end": "01/01/2020", "days": 1},
+        {"start": "04/01/2020", "end": "09/01/2020", "days": 6},
+        {"start": "12/01/2020", "end": "19/01/2020", "days": 8},
+        {"start": "22/01/2020", "end": "31/01/2020", "days": 10}
+    ]
+    total_tests += 1
+    if run_test_case("Unsorted records with many contracts", test11_data, 25, expected_periods_11):
+        passed_tests += 1
+
+    # Test Case 12: Overlapping vacations are counted independently, in input order
+    test12_data = [
+        {"isVacaciones": True, "fechaAlta": "10/01/2020", "fechaBaja": "14/01/2020"},  # 5 days vacation
+        {"isVacaciones": True, "fechaAlta": "01/01/2020", "fechaBaja": "12/01/2020"},  # 12 days vacation
+        {"isVacaciones": False, "fechaAlta": "05/01/2020", "fechaBaja": "10/01/2020"}  # contract
+    ]
+    # First vacation: 11-14/01 = 4 days. Second vacation: 01-04/01 and 11-12/01 = 6 days
+    expected_periods_12 = [
+        {"start": "11/01/2020", "end": "14/01/2020", "days": 4},
+        {"start": "01/01/2020", "end": "04/01/2020", "days": 4},
+        {"start": "11/01/2020", "end": "12/01/2020", "days": 2}
+    ]
+    total_tests += 1
+    if run_test_case("Overlapping vacations", test12_data, 10, expected_periods_12):
+        passed_tests += 1
+
+    # Test Case 13: Vacation with end date before start date is ignored
+    test13_data = [
+        {"isVacaciones": True, "fechaAlta": "10/01/2020", "fechaBaja": "01/01/2020"},  # inverted (ignored)
+        {"isVacaciones": True, "fechaAlta": "01/02/2020", "fechaBaja": "02/02/2020"}   # 2 days vacation
+    ]
+    total_tests += 1
+    if run_test_case("Inverted vacation dates", test13_data, 2):
+        passed_tests += 1
+
+    # Test Case 14: Batch mode over all previous cases, one worker per case
+    records_by_worker = {
+        f"worker_{i}": data for i, data in enumerate([
+            test1_data, test2_data, test3_data, test4_data, test5_data, test6_data, test7_data,
+            test8_data, test9_data, test10_data, test11_data, test12_data, test13_data
+        ], 1)
+    }
+    total_tests += 1
+    if run_batch_test_case("Batch matches per-worker results", records_by_worker):
+        passed_tests += 1
+
+    # Test Case 15: Incremental session updates on test 10 data
+    moved_contract = {"isVacaciones": False, "fechaAlta": "04/01/2020", "fechaBaja": "21/01/2020"}
+    new_vacation = {"isVacaciones": True, "fechaAlta": "01/02/2020", "fechaBaja": "03/02/2020"}
+    test15_changes = [
+        {"op": "update", "id": 3, "record": moved_contract},  # contract now reaches the third vacation
+        {"op": "delete", "id": 0},
+        {"op": "add", "id": 4, "record": new_vacation}
+    ]
+    test15_expected = [test10_data[1], test10_data[2], moved_contract, new_vacation]
+    total_tests += 1
+    if run_session_test_case("Incremental session changes", test10_data, test15_changes, test15_expected):
+        passed_tests += 1
+
+    # Test Case 16: Typed records give the same result as record dicts
+    test16_data = [Record.from_dict(item) for item in test11_data]
+    total_tests += 1
+    if run_test_case("Typed records", test16_data, 25, expected_periods_11):
+        passed_tests += 1
+
+    # Test Case 17: Range queries on test 10 data (11 uncovered and 6 covered days overall)
+    test17_queries = [
+        (None, None, 11, 6),
+        ("01/01/2020", "05/01/2020", 2, 3),   # first vacation
+        (None, "09/01/2020", 2, 3),           # before the second vacation
+        ("11/01/2020", "21/01/2020", 5, 2),   # 11-12/01 covered, 13-15/01 and 20-21/01 uncovered
+        ("01/01/2021", "31/12/2021", 0, 0)    # no vacations
+    ]
+    total_tests += 1
+    if run_timeline_test_case("Timeline range queries", test10_data, test17_queries):
+        passed_tests += 1
+
+    # Test Case 18: Text backend on a generated report. The cover page is
+    # skipped and the last company name of page 2 continues below the header
+    # of page 3
+    header = [(40, 340, "SITUACIÓN/ES"),
+              (40, 320, "RÉGIMEN"), (100, 320, "CÓDIGO"), (170, 320, "EMPRESA"), (330, 320, "FECHA"),
+              (390, 320, "FECHA"), (450, 320, "FECHA"), (510, 320, "C.T."), (545, 320, "CTP %"),
+              (575, 320, "G.C."), (610, 320, "DÍAS"),
+              (330, 310, "ALTA"), (390, 310, "EFECTO ALTA"), (450, 310, "BAJA")]
+
+    def report_row(y, code, empresa, alta, baja, dias):
+        return [(40, y, "GENERAL"), (100, y, code), (170, y, empresa), (330, y, alta), (390, y, alta),
+                (450, y, baja), (510, y, "401"), (575, y, "05"), (610, y, dias)]
+
+    test18_pages = [
+        [(40, 370, "INFORME DE VIDA LABORAL")],
+        header + report_row(295, "28100123456", "HOSPITAL UNIVERSITARIO", "01.02.2020", "31.05.2020", "121")
+        + [(170, 285, "CENTRAL")]
+        + report_row(270, "33100654321", "SERVICIO DE SALUD DEL", "01.06.2020", "---", "1.085"),
+        header + [(170, 298, "PRINCIPADO DE ASTURIAS")]
+        + report_row(280, "33100777777", "CARREFOUR", "02.01.2019", "15.01.2019", "14"),
+    ]
+    test18_rows = [
+        ["GENERAL", "28100123456", "HOSPITAL UNIVERSITARIO CENTRAL",
+         "01.02.2020", "01.02.2020", "31.05.2020", "401", "", "05", "121"],
+        ["GENERAL", "33100654321", "SERVICIO DE SALUD DEL PRINCIPADO DE ASTURIAS",
+         "01.06.2020", "01.06.2020", "---", "401", "", "05", "1.085"],
+        ["GENERAL", "33100777777", "CARREFOUR",
+         "02.01.2019", "02.01.2019", "15.01.2019", "401", "", "05", "14"],
+    ]
+    total_tests += 1
+    if run_pdf_extraction_test_case("Text backend with a page-break continuation",
+                                    test18_pages, test18_rows, workers=1):
+        passed_tests += 1
+
+    # Test Case 19: Same report with the pages spread over the shared process pool
+    total_tests += 1
+    if run_pdf_extraction_test_case("Text backend in worker processes",
+                                    test18_pages, test18_rows, workers=2):
+        passed_tests += 1
+
+    # Test Case 20: Day counts over 999 carry a thousands dot
+    def dias_row(dias):
+        return ["GENERAL", "28100123456", "HOSPITAL", "01.02.2020", "01.02.2020", "31.05.2020",
+                "401", "", "05", dias]
+
+    test20_rows = [dias_row("121"), dias_row("---"), dias_row("1.085"), dias_row(""),
+                   dias_row("1085"), dias_row("12a"), dias_row("1.08")]
+    test20_invalid = [(5, "Dias", "12a"), (6, "Dias", "1.08")]
+    total_tests += 1
+    if run_normalize_test_case("Dias with thousands dots", test20_rows,
+                               [121, None, 1085, None, 1085, None, None], test20_invalid):
+        passed_tests += 1
+
+    # Test Case 21: Validation of OCR output and of single records
+    vacation = {"isVacaciones": True, "fechaAlta": "01/07/2020", "fechaBaja": "15/07/2020", "rowPosition": 0.2}
+    active = {"isVacaciones": False, "fechaAlta": "01/09/2020", "fechaBaja": "", "rowPosition": 0.4}
+    impossible = dict(vacation, fechaAlta="31/02/2020")
+    inverted = dict(vacation, fechaBaja="01/06/2020")
+    unreadable = dict(vacation, fechaBaja="1S/07/2020")
+    test21_cases = [
+        ("valid records", validate_ocr_records, ([vacation, active],), {}, []),
+        ("empty image", validate_ocr_records, ([],), {}, ["no records"]),
+        ("empty band", validate_ocr_records, ([],), {"allow_empty": True}, []),
+        ("too many records", validate_ocr_records, ([vacation] * 3,), {"max_records": 2}, ["3 records"]),
+        ("invalid second record", validate_ocr_records, ([vacation, impossible],), {},
+         ["record 2: invalid fechaAlta '31/02/2020'"]),
+        ("active contract", record_problems, (active,), {}, []),
+        ("impossible date", record_problems, (impossible,), {}, ["invalid fechaAlta '31/02/2020'"]),
+        ("unreadable fechaBaja", record_problems, (unreadable,), {}, ["invalid fechaBaja '1S/07/2020'"]),
+        ("inverted dates", record_problems, (inverted,), {}, ["fechaBaja before fechaAlta"]),
+    ]
+    total_tests += 1
+    if run_ocr_validation_test_case("OCR output validation", test21_cases):
+        passed_tests += 1
+
+    # Test Cases 22-24: Merging the records of overlapping row bands. Band
+    # 1 holds rows 0-5, band 2 rows 4-9 and band 3 rows 8-11
+    bands = [(0, 600), (400, 1000), (800, 1200)]
+    band_rows = [range(0, 6), range(4, 10), range(8, 12)]
+    all_rows = [f"{row + 1:02d}/01/2020" for row in range(12)]
+    test22_records = [[band_record(row, band) for row in rows] for rows, band in zip(band_rows, bands)]
+    total_tests += 1
+    if run_band_merge_test_case("Band overlap", test22_records, bands, all_rows):
+        passed_tests += 1
+
+    # Row 5 is cut at the bottom of band 1 and misread there
+    test23_records = [[band_record(row, bands[0], "31/12/1999" if row == 5 else None) for row in band_rows[0]],
+                      test22_records[1], test22_records[2]]
+    total_tests += 1
+    merged = merge_band_records(test23_records, bands)
+    if (run_band_merge_test_case("Band overlap read differently", test23_records, bands, all_rows)
+            and merged[5]["fechaBaja"] == "06/02/2020"):
+        passed_tests += 1
+
+    test24_records = [test22_records[0], [], test22_records[2]]
+    total_tests += 1
+    if run_band_merge_test_case("Empty band", test24_records, bands,
+                                all_rows[:6] + all_rows[8:]):
+        passed_tests += 1
+
+    # Test Cases 25-28: Extraction cache
+    for name, check in [("Extraction cache hit and miss", check_cache_hits),
+                        ("Extraction cache LRU eviction", check_cache_eviction),
+                        ("Concurrent extractions of the same PDF", check_cache_single_flight),
+                        ("Extraction cache write error", check_cache_write_error)]:
+        total_tests += 1
+        if run_extraction_cache_test_case(name, check):
+            passed_tests += 1
+
+    # Test Case 29: Misread OCR dates reach the editor as read, so the user
+    # can correct them, and the contract isn't treated as open-ended
+    print("\n--- Test Case: Misread OCR dates ---")
+    test29_rows = [r.to_editor_dict() for r in convert_ocr_to_extract_format([
+        {"isVacaciones": False, "fechaAlta": "01.07.2020", "fechaBaja": "1S.07.2020"},
+        {"isVacaciones": True, "fechaAlta": "02.07.2020", "fechaBaja": "1O.07.2020"}
+    ])]
+    test29_expected = [
+        {"type": "contract", "fechaAlta": "01/07/2020", "fechaBaja": "1S/07/2020"},
+        {"type": "vacation", "fechaAlta": "02/07/2020", "fechaBaja": "1O/07/2020"}
+    ]
+    test29_records = [Record.from_dict(row) for row in test29_rows]
+    print(f"Editor rows: {test29_rows}")
+    total_tests += 1
+    if test29_rows == test29_expected and test29_records[0].interval(datetime.date.today().toordinal()) is None:
+        print("✅ PASS")
+        passed_tests += 1
+    else:
+        print("❌ FAIL")
+
     print(f"\n{'='*50}")
     print(f"Test Results: {passed_tests}/{total_tests} tests passed")
     if passed_tests == total_tests:
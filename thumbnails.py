@@ -0,0 +1,111 @@
+"""
+Disk store of image preview thumbnails.
+
+The extraction results only carry the URL of each preview; the page loads
+the downscaled JPEG from GET /thumbnails/<key>.jpg. Thumbnails are
+content-addressed: the key is the SHA-256 of the uploaded image bytes
+together with the thumbnail settings, so a given URL always serves the same
+bytes and can be cached by the browser forever, and the same photo uploaded
+again reuses its thumbnail. The store is bounded in size and evicts the
+least recently used thumbnails first.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+from PIL import Image, ImageOps
+
+# Bump when the way thumbnails are drawn changes
+THUMBNAIL_VERSION = "1"
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+_KEY = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ThumbnailStore:
+    """
+    Size-bounded LRU store of JPEG thumbnails, at most max_size pixels on
+    their longest side, stored as one file per key. Recency is tracked with
+    the file modification time, which is refreshed on every read.
+    """
+
+    def __init__(self, directory, max_size=1200, quality=80, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_size = max_size
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, image_path):
+        """SHA-256 of the image bytes plus the thumbnail settings."""
+        digest = hashlib.sha256()
+        with open(image_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        digest.update(f"\0{THUMBNAIL_VERSION}\0{self.max_size}\0{self.quality}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.jpg")
+
+    def add(self, image_path):
+        """Store the thumbnail of an image unless it is already there; returns its key."""
+        key = self.key(image_path)
+        path = self._path(key)
+        if os.path.exists(path):
+            os.utime(path)
+            return key
+
+        with Image.open(image_path) as image:
+            # Phone photos are often stored sideways with an EXIF rotation
+            thumbnail = ImageOps.exif_transpose(image).convert("RGB")
+        thumbnail.thumbnail((self.max_size, self.max_size), Image.LANCZOS)
+        # Write to a temporary file first so readers never see half a thumbnail
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                thumbnail.save(f, "JPEG", quality=self.quality, optimize=True, progressive=True)
+            os.replace(temp_path, path)
+        except Exception:
+            # _evict only counts .jpg files, so a leftover would never be removed
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        with self._lock:
+            self._evict()
+        return key
+
+    def path(self, key):
+        """File of a stored thumbnail, or None for unknown or malformed keys."""
+        if not _KEY.match(key):
+            return None
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".jpg"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,305 @@
+"""
+Shared engine for calculating vacation days that don't overlap with contracts.
+
+Records (or record dicts, which are parsed once into the same integer day
+ordinals) are split into vacations and contracts, contracts are merged
+into sorted disjoint intervals and the vacations are swept against them in a
+single pass, so the whole calculation is O((V+C) log(V+C)) instead of O(V×C).
+
+The batch functions run the same calculation for many workers at once over
+columnar NumPy arrays, without any per-record Python work.
+"""
+import datetime
+
+import numpy as np
+
+from records import INVALID_DATE, Record, format_ordinal
+
+
+def parse_record(item, today):
+    """
+    Return (is_vacation, start, end) day ordinals for a Record or a record
+    dict, or None for records with missing, invalid or inverted dates.
+    Contracts without an end date are considered active until today.
+    """
+    if not isinstance(item, Record):
+        item = Record.from_dict(item)
+    return item.interval(today)
+
+
+def parse_records(data, today=None):
+    """
+    Split records into vacation and contract intervals of day ordinals.
+
+    Vacations keep their input position so results can be reported in the
+    original order. Invalid records are ignored as in parse_record.
+    """
+    if today is None:
+        today = datetime.date.today().toordinal()
+
+    vacations, contracts = [], []
+    for item in data:
+        parsed = parse_record(item, today)
+        if parsed is None:
+            continue
+
+        is_vacation, start, end = parsed
+        if is_vacation:
+            vacations.append((start, end, len(vacations)))
+        else:
+            contracts.append((start, end))
+
+    return vacations, contracts
+
+
+def merge_intervals(intervals):
+    """Merge inclusive (start, end) intervals into sorted disjoint ones."""
+    merged = []
+    for start, end in sorted(intervals):
+        # Adjacent days are merged as well since the intervals are inclusive
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_coverage(vacations, coverage):
+    """
+    Sweep vacations against merged coverage intervals.
+
+    Returns, for each vacation in its input order, the list of uncovered
+    (start, end) segments.
+    """
+    segments = [None] * len(vacations)
+    first = 0  # first coverage interval that can still reach a vacation
+
+    for vac_start, vac_end, index in sorted(vacations):
+        # Vacations are visited by start date, so intervals ending before
+        # this vacation can't touch any of the following ones either
+        while first < len(coverage) and coverage[first][1] < vac_start:
+            first += 1
+
+        uncovered = []
+        current_pos = vac_start
+        i = first
+        while i < len(coverage) and coverage[i][0] <= vac_end:
+            cover_start, cover_end = coverage[i]
+            if current_pos < cover_start:
+                uncovered.append((current_pos, cover_start - 1))
+            current_pos = max(current_pos, cover_end + 1)
+            i += 1
+
+        if current_pos <= vac_end:
+            uncovered.append((current_pos, vac_end))
+
+        segments[index] = uncovered
+
+    return segments
+
+
+def calculate_non_overlapping_vacation_days(data):
+    """
+    Calculate vacation days that don't overlap with contract periods.
+    Returns both the total days and the specific non-overlapping periods.
+    """
+    vacations, contracts = parse_records(data)
+    coverage = merge_intervals(contracts)
+
+    total_non_overlapping_days = 0
+    non_overlapping_periods = []
+
+    for uncovered in subtract_coverage(vacations, coverage):
+        for start, end in uncovered:
+            days = end - start + 1
+            total_non_overlapping_days += days
+            non_overlapping_periods.append({
+                "start": format_ordinal(start),
+                "end": format_ordinal(end),
+                "days": days
+            })
+
+    return total_non_overlapping_days, non_overlapping_periods
+
+
+def records_to_arrays(records_by_worker):
+    """
+    Convert {worker_id: [record, ...]} into the columnar arrays used by
+    calculate_batch_segments: (worker_ids, is_vacation, starts, ends).
+
+    Records may be Record objects or record dicts. Dates become datetime64[D]
+    values and missing or invalid dates become NaT. Contracts with an end
+    date that is present but invalid get both dates set to NaT so they are
+    ignored, exactly as in the per-worker calculation.
+    """
+    worker_ids, is_vacation, starts, ends = [], [], [], []
+    for worker_id, data in records_by_worker.items():
+        for item in data:
+            if not isinstance(item, Record):
+                item = Record.from_dict(item)
+            start, end = item.start, item.end
+            if not item.is_vacation and end == INVALID_DATE:
+                start, end = None, None
+            worker_ids.append(worker_id)
+            is_vacation.append(item.is_vacation)
+            starts.append(_ordinal_to_datetime64(start))
+            ends.append(_ordinal_to_datetime64(end))
+
+    return (
+        np.array(worker_ids),
+        np.array(is_vacation, dtype=bool),
+        np.array(starts, dtype="datetime64[D]"),
+        np.array(ends, dtype="datetime64[D]"),
+    )
+
+
+def _ordinal_to_datetime64(ordinal):
+    if not ordinal:
+        return np.datetime64("NaT", "D")
+    return np.datetime64(datetime.date.fromordinal(ordinal), "D")
+
+
+def calculate_batch_segments(worker_ids, is_vacation, starts, ends, today=None):
+    """
+    Calculate non-overlapping vacation segments for many workers at once.
+
+    Parameters
+    ----------
+    worker_ids : array-like
+        Worker identifier of every record.
+    is_vacation : array-like of bool
+        True for vacation records, False for contracts.
+    starts, ends : array-like of datetime64[D]
+        Start and end dates. NaT marks a missing date; contracts with a NaT
+        end are considered active until today.
+
+    Returns
+    -------
+    (workers, totals, segments) where workers holds the sorted unique worker
+    ids, totals the non-overlapping days for each of them, and segments is a
+    dict of columnar arrays "worker", "start", "end" and "days". Segments are
+    grouped by worker and keep the per-worker order of the scalar function.
+    """
+    worker_ids = np.asarray(worker_ids)
+    is_vacation = np.asarray(is_vacation, dtype=bool)
+    starts = np.asarray(starts, dtype="datetime64[D]")
+    ends = np.asarray(ends, dtype="datetime64[D]")
+    if today is None:
+        today = datetime.date.today()
+    today = np.datetime64(today, "D")
+
+    workers, worker_rank = np.unique(worker_ids, return_inverse=True)
+    worker_rank = worker_rank.reshape(-1)
+
+    # Open contracts run until today
+    ends = np.where(~is_vacation & np.isnat(ends), today, ends)
+    valid = ~np.isnat(starts) & ~np.isnat(ends) & (ends >= starts)
+
+    start_days = starts.astype(np.int64)
+    end_days = ends.astype(np.int64)
+
+    # Shift every worker into its own disjoint band of integer keys so one
+    # global sort and search handles all workers without mixing them up
+    if valid.any():
+        low = min(start_days[valid].min(), end_days[valid].min())
+        high = max(start_days[valid].max(), end_days[valid].max())
+    else:
+        low = high = 0
+    band = high - low + 2
+    offset = worker_rank.astype(np.int64) * band - low
+    start_keys = start_days + offset
+    end_keys = end_days + offset
+
+    # Merge contracts per worker: sort by key and start a new interval
+    # whenever a contract begins after everything seen so far has ended
+    contract = valid & ~is_vacation
+    order = np.argsort(start_keys[contract], kind="stable")
+    c_start = start_keys[contract][order]
+    c_end = np.maximum.accumulate(end_keys[contract][order]) if c_start.size else c_start
+    new_group = np.ones(c_start.size, dtype=bool)
+    new_group[1:] = c_start[1:] > c_end[:-1] + 1
+    last_in_group = np.ones(c_start.size, dtype=bool)
+    last_in_group[:-1] = new_group[1:]
+    merged_start = c_start[new_group]
+    merged_end = c_end[last_in_group]
+
+    # Locate the merged intervals touching each vacation
+    vacation = valid & is_vacation
+    v_start = start_keys[vacation]
+    v_end = end_keys[vacation]
+    v_offset = offset[vacation]
+    first = np.searchsorted(merged_end, v_start, side="left")
+    overlaps = np.searchsorted(merged_start, v_end, side="right") - first
+
+    # A vacation touching n intervals has up to n + 1 uncovered gaps: before
+    # the first interval, between consecutive ones and after the last one
+    counts = overlaps + 1
+    vac_index = np.repeat(np.arange(v_start.size), counts)
+    gap = np.arange(vac_index.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    interval = first[vac_index] + gap
+
+    # Sentinel so the clipped lookups below are valid when there are no contracts
+    merged_start = np.append(merged_start, 0)
+    merged_end = np.append(merged_end, 0)
+    last = merged_start.size - 1
+    seg_start = np.where(
+        gap == 0,
+        v_start[vac_index],
+        merged_end[np.clip(interval - 1, 0, last)] + 1,
+    )
+    seg_end = np.where(
+        gap == overlaps[vac_index],
+        v_end[vac_index],
+        merged_start[np.clip(interval, 0, last)] - 1,
+    )
+
+    keep = seg_start <= seg_end
+    seg_worker = worker_rank[vacation][vac_index][keep]
+    seg_start = seg_start[keep] - v_offset[vac_index][keep]
+    seg_end = seg_end[keep] - v_offset[vac_index][keep]
+    seg_days = seg_end - seg_start + 1
+
+    # Vacations are still in input order, so a stable sort by worker keeps
+    # the same segment order as the per-worker calculation
+    by_worker = np.argsort(seg_worker, kind="stable")
+    seg_worker = seg_worker[by_worker]
+    segments = {
+        "worker": workers[seg_worker],
+        "start": seg_start[by_worker].astype("datetime64[D]"),
+        "end": seg_end[by_worker].astype("datetime64[D]"),
+        "days": seg_days[by_worker],
+    }
+    totals = np.bincount(seg_worker, weights=seg_days[by_worker],
+                         minlength=workers.size).astype(np.int64)
+
+    return workers, totals, segments
+
+
+def format_datetime64(dates):
+    """Format an array of datetime64[D] values as a list of DD/MM/YYYY strings."""
+    return [f"{iso[8:10]}/{iso[5:7]}/{iso[:4]}"
+            for iso in np.datetime_as_string(np.asarray(dates, dtype="datetime64[D]"), unit="D")]
+
+
+def calculate_batch_non_overlapping_vacation_days(worker_ids, is_vacation, starts, ends,
+                                                  today=None):
+    """
+    Batch version of calculate_non_overlapping_vacation_days.
+    Returns {worker_id: (total_days, periods)} with the same values the
+    per-worker function returns for each worker's records.
+    """
+    workers, totals, segments = calculate_batch_segments(
+        worker_ids, is_vacation, starts, ends, today=today)
+
+    start_strings = format_datetime64(segments["start"])
+    end_strings = format_datetime64(segments["end"])
+    days = segments["days"].tolist()
+
+    results = {worker_id: (total, [])
+               for worker_id, total in zip(workers.tolist(), totals.tolist())}
+    for worker_id, start, end, n in zip(segments["worker"].tolist(), start_strings,
+                                        end_strings, days):
+        results[worker_id][1].append({"start": start, "end": end, "days": n})
+
+    return results
@@ -0,0 +1,101 @@
+"""
+Day-by-day timeline of covered and uncovered vacation days for one worker.
+
+The timeline is built once from the same segments the calculator produces
+and keeps prefix sums per day, so any date-range question ("uncovered days
+in 2010", "covered days before 01/01/2008") is answered in O(1) without
+re-running the calculation on filtered input.
+"""
+import datetime
+
+import numpy as np
+
+from records import format_ordinal, parse_date
+from vacation_calculator import merge_intervals, parse_records, subtract_coverage
+
+
+def to_day(value):
+    """Convert a day ordinal, date or DD/MM/YYYY string to a day ordinal; None stays None."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime.date):
+        return value.toordinal()
+    if isinstance(value, str):
+        ordinal = parse_date(value)
+        if ordinal is None:
+            raise ValueError(f"Invalid date: {value}")
+        return ordinal
+    return int(value)
+
+
+class VacationTimeline:
+    """
+    Prefix sums of vacation, covered and uncovered vacation days per day.
+
+    Days are counted the same way as calculate_non_overlapping_vacation_days:
+    a day that belongs to two vacations counts twice.
+    """
+
+    def __init__(self, data, today=None):
+        vacations, contracts = parse_records(data, today)
+        segments = subtract_coverage(vacations, merge_intervals(contracts))
+
+        if vacations:
+            self.first_day = min(start for start, _, _ in vacations)
+            self.last_day = max(end for _, end, _ in vacations)
+        else:
+            self.first_day, self.last_day = 0, -1
+
+        self._vacation_prefix = self._prefix_sums(
+            [(start, end) for start, end, _ in vacations])
+        self._uncovered_prefix = self._prefix_sums(
+            [segment for uncovered in segments for segment in uncovered])
+
+    def _prefix_sums(self, intervals):
+        # Difference array of interval starts and ends, accumulated twice:
+        # once for the count per day and once for the running total
+        size = self.last_day - self.first_day + 2
+        diff = np.zeros(size, dtype=np.int64)
+        if intervals:
+            bounds = np.array(intervals, dtype=np.int64) - self.first_day
+            np.add.at(diff, bounds[:, 0], 1)
+            np.add.at(diff, bounds[:, 1] + 1, -1)
+        per_day = np.cumsum(diff[:-1])
+        return np.concatenate(([0], np.cumsum(per_day)))
+
+    def _index(self, day):
+        return min(max(day - self.first_day, 0), self.last_day - self.first_day + 1)
+
+    def _sum(self, prefix, start, end):
+        start, end = to_day(start), to_day(end)
+        lo = 0 if start is None else self._index(start)
+        hi = len(prefix) - 1 if end is None else self._index(end + 1)
+        return int(prefix[hi] - prefix[lo]) if hi > lo else 0
+
+    def vacation_days(self, start=None, end=None):
+        """Vacation days in the inclusive range; None leaves a side open."""
+        return self._sum(self._vacation_prefix, start, end)
+
+    def uncovered_days(self, start=None, end=None):
+        """Vacation days in the range that don't overlap with any contract."""
+        return self._sum(self._uncovered_prefix, start, end)
+
+    def covered_days(self, start=None, end=None):
+        """Vacation days in the range that overlap with a contract."""
+        return self.vacation_days(start, end) - self.uncovered_days(start, end)
+
+    def query(self, start=None, end=None):
+        start, end = to_day(start), to_day(end)
+        vacation_days = self.vacation_days(start, end)
+        uncovered_days = self.uncovered_days(start, end)
+        return {
+            "start": format_ordinal(start),
+            "end": format_ordinal(end),
+            "vacation_days": vacation_days,
+            "covered_days": vacation_days - uncovered_days,
+            "uncovered_days": uncovered_days
+        }
+
+    def year(self, year):
+        """Shortcut for the query of a whole calendar year."""
+        return self.query(datetime.date(year, 1, 1), datetime.date(year, 12, 31))